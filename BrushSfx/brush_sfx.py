@@ -1,5 +1,5 @@
 from krita import *
-from .Qt.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QLabel, QDialog, QSlider, QCheckBox
+from .Qt.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QLabel, QDialog, QSlider, QCheckBox, QSpinBox
 from .Qt.QtCore import Qt, Signal, QObject, QEvent, QTimer, QPoint, QThread
 from .Qt.QtGui import QCursor, QGuiApplication
 from .Qt5to6 import *
@@ -7,6 +7,7 @@ from .Qt5to6 import *
 import time
 import math
 import copy
+import functools
 from typing import List
 
 import numpy as np
@@ -14,17 +15,23 @@ import sounddevice as sd
 
 from .utils import clamp, lerp
 from .sound import sound_player
-from .constants import DEFAULT_VOLUME, DEFAULT_SFX_ID, DEFAULT_USE_ERASER, DEFAULT_ERASER_SFX_ID, plugin_version
+from .constants import DEFAULT_VOLUME, DEFAULT_SFX_ID, DEFAULT_USE_ERASER, DEFAULT_ERASER_SFX_ID, plugin_version, \
+DEFAULT_FILTER_BACKEND, FILTER_BACKEND_FFT, FILTER_BACKEND_BIQUAD, FILTER_BACKEND_WAVETABLE, DEFAULT_WAVETABLE_ANCHORS, \
+BLOCK_SIZES, DEFAULT_BLOCKSIZE, VARIABLE_BLOCKSIZE, LATENCY_LOW, LATENCY_HIGH, DEFAULT_LATENCY, DEFAULT_IDLE_SUSPEND_SECONDS, \
+DEFAULT_CROSSFADE_SECONDS
 from .sound_source import WavObject, generate_from_file, SFXSource, \
-SilenceSfx, EraserSfx, PencilSFXSource, PenSFXSource, PaintBrushSfx ,AirbrushSfx, SpraycanSfx
+SilenceSfx, EraserSfx, PencilSFXSource, PenSFXSource, PaintBrushSfx ,AirbrushSfx, SpraycanSfx, SamplePackSfx
 from .filter import LowPassFilter, apply_filter, PeakFilter
 from .input import InputListener, input_listener, brush_preset_listener
+from .source_factory import sound_source_factory
+from .sample_packs import sample_pack_scanner
 
 from .resources import bsfxConfig, bsfxResourceRepository
  
 class BrushSFXExtension(Extension):
 
     soundChanged = Signal(SFXSource)
+    soundSourceBuilt = Signal(object, object, object)
 
     def __init__(self, parent):
         super().__init__(parent)
@@ -41,6 +48,9 @@ class BrushSFXExtension(Extension):
         self.player.moveToThread(self.sound_player_thread)
         self.soundChanged.connect(self.player.setSoundSource)
         self.sound_player_thread.start()
+
+        self.source_factory = sound_source_factory
+        self.soundSourceBuilt.connect(self.__onSoundSourceBuilt)
         
         self.__sound_options = []
         self.sfx_config_in_use:bsfxConfig = bsfxConfig("", True, "",1.0)
@@ -48,6 +58,13 @@ class BrushSFXExtension(Extension):
         #general settings
         self.__using_tool_detection = True
         self.__constrain_to_canvas = True
+        self.__warm_standby = True
+        self.__filter_backend = DEFAULT_FILTER_BACKEND
+        self.__wavetable_anchors = DEFAULT_WAVETABLE_ANCHORS
+        self.__blocksize = DEFAULT_BLOCKSIZE
+        self.__latency = DEFAULT_LATENCY
+        self.__idle_suspend_seconds = DEFAULT_IDLE_SUSPEND_SECONDS
+        self.__crossfade_ms = int(DEFAULT_CROSSFADE_SECONDS * 1000)
         self.is_sfx_on = False
         self.general_sfx_config: bsfxConfig = bsfxConfig("", True, "", 0.5)
         
@@ -64,6 +81,8 @@ class BrushSFXExtension(Extension):
         self.addSoundOption("bsfx_paintbrush", "paint brush", PaintBrushSfx, remain_cached = True)
         self.addSoundOption("bsfx_airbrush", "airbrush", AirbrushSfx, remain_cached = True)
         self.addSoundOption("bsfx_spraycan", "spray can", SpraycanSfx, remain_cached = True)
+        for pack in sample_pack_scanner.scan():
+            self.addSoundOption(f"bsfx_pack_{pack.id}", pack.name, functools.partial(SamplePackSfx, pack=pack))
 
         self.dialogWidget = QDialog()
         self.__createDialog()
@@ -73,6 +92,7 @@ class BrushSFXExtension(Extension):
 
         self.refreshSoundSourceOfPlayer()
         self.refreshVolumeOfPlayer()
+        self.__prefetchSoundSources()
 
     def setup(self):
         pass
@@ -86,7 +106,7 @@ class BrushSFXExtension(Extension):
             "sfx_id": sfx_id,
             "name": name,
             "sound_source_class": sound_source_class,
-            "sound_sorce_cache": None,
+            "sound_source_future": None,
             "remain_cached": remain_cached
         }
         self.__sound_options += [new_sound_option]                                                                                
@@ -111,6 +131,98 @@ class BrushSFXExtension(Extension):
     Sound effects will not play if using a tool that shouldn't make sound (i.e select tool, transform tool, etc).\n
     Doesn't affect brush preset detection""")
 
+        # Filtering
+            # label
+        filter_backend_label = QLabel("Sound filtering:", self.dialogWidget)
+        filter_backend_label.setFixedWidth(100)
+            # combobox
+        self.__filter_backend_options = [FILTER_BACKEND_FFT, FILTER_BACKEND_BIQUAD, FILTER_BACKEND_WAVETABLE]
+        self.filter_backend_cb = QComboBox(self.dialogWidget)
+        self.filter_backend_cb.addItems(["fourier transform", "biquad (low CPU)", "wavetables (lowest CPU)"])
+        self.filter_backend_cb.currentIndexChanged.connect(self.__filterBackendChanged)
+        self.filter_backend_cb.setToolTip("""How sound effects are filtered while drawing
+    Use biquad or wavetables if the sound crackles on a low power machine, the sounds will be slightly different.\n
+    wavetables are rendered when selected, more tables use more memory but sound closer to the fourier transform""")
+            # wavetable count
+        self.wavetable_anchors_sb = QSpinBox(self.dialogWidget)
+        self.wavetable_anchors_sb.setRange(2, 64)
+        self.wavetable_anchors_sb.setSuffix(" tables")
+        self.wavetable_anchors_sb.setKeyboardTracking(False)
+        self.wavetable_anchors_sb.valueChanged.connect(self.__wavetableAnchorsChanged)
+            # layout
+        filter_backend_layout = QHBoxLayout()
+        filter_backend_layout.addWidget(filter_backend_label)
+        filter_backend_layout.addWidget(self.filter_backend_cb)
+        filter_backend_layout.addWidget(self.wavetable_anchors_sb)
+
+        # Audio buffer
+            # label
+        stream_label = QLabel("Audio buffer:", self.dialogWidget)
+        stream_label.setFixedWidth(100)
+            # block size
+        self.blocksize_cb = QComboBox(self.dialogWidget)
+        self.blocksize_cb.addItems([f"{blocksize} samples" if blocksize != VARIABLE_BLOCKSIZE else "variable"
+                                    for blocksize in BLOCK_SIZES])
+        self.blocksize_cb.currentIndexChanged.connect(self.__blocksizeChanged)
+        self.blocksize_cb.setToolTip("""Samples played per block
+    Smaller blocks answer the pen sooner but use more CPU, use a bigger block if the sound crackles.\n
+    variable lets the audio device choose, it's usually the fastest but not every device handles it well""")
+            # latency
+        self.__latency_options = [LATENCY_LOW, LATENCY_HIGH]
+        self.latency_cb = QComboBox(self.dialogWidget)
+        self.latency_cb.addItems(["low latency", "high latency"])
+        self.latency_cb.currentIndexChanged.connect(self.__latencyChanged)
+        self.latency_cb.setToolTip("""Latency asked to the audio device
+    High latency keeps more audio queued, it's safer on a busy machine but the sound comes later""")
+            # layout
+        stream_layout = QHBoxLayout()
+        stream_layout.addWidget(stream_label)
+        stream_layout.addWidget(self.blocksize_cb)
+        stream_layout.addWidget(self.latency_cb)
+
+        # Idle suspend
+            # label
+        idle_suspend_label = QLabel("Suspend audio:", self.dialogWidget)
+        idle_suspend_label.setFixedWidth(100)
+            # spinbox
+        self.idle_suspend_sb = QSpinBox(self.dialogWidget)
+        self.idle_suspend_sb.setRange(0, 600)
+        self.idle_suspend_sb.setPrefix("after ")
+        self.idle_suspend_sb.setSuffix(" s of silence")
+        self.idle_suspend_sb.setSpecialValueText("never")
+        self.idle_suspend_sb.setKeyboardTracking(False)
+        self.idle_suspend_sb.valueChanged.connect(self.__idleSuspendChanged)
+        self.idle_suspend_sb.setToolTip("""Stops the audio stream while nothing is being drawn
+    It starts again on the next input on the canvas, so idle Krita doesn't keep the audio device busy""")
+            # layout
+        idle_suspend_layout = QHBoxLayout()
+        idle_suspend_layout.addWidget(idle_suspend_label)
+        idle_suspend_layout.addWidget(self.idle_suspend_sb)
+
+        # Crossfade
+            # label
+        crossfade_label = QLabel("Crossfade:", self.dialogWidget)
+        crossfade_label.setFixedWidth(100)
+            # spinbox
+        self.crossfade_sb = QSpinBox(self.dialogWidget)
+        self.crossfade_sb.setRange(0, 1000)
+        self.crossfade_sb.setSingleStep(10)
+        self.crossfade_sb.setSuffix(" ms")
+        self.crossfade_sb.setKeyboardTracking(False)
+        self.crossfade_sb.valueChanged.connect(self.__crossfadeChanged)
+        self.crossfade_sb.setToolTip("""Crossfade between sounds
+    How long the previous sound takes to fade out when the sound changes, for example when switching brush presets""")
+            # layout
+        crossfade_layout = QHBoxLayout()
+        crossfade_layout.addWidget(crossfade_label)
+        crossfade_layout.addWidget(self.crossfade_sb)
+
+        self.warm_standby_checkbox = QCheckBox("Keep audio ready when off", self.dialogWidget)
+        self.warm_standby_checkbox.checkStateChanged.connect(self.__switchWarmStandby)
+        self.warm_standby_checkbox.setToolTip("""Keep audio ready when off
+    Turning sound effects off keeps the audio device open and playing silence, so turning them back on is instant.\n
+    Uncheck to release the audio device while sound effects are off""")
+
         self.constrain_to_canvas_checkbox = QCheckBox("Constrain to canvas", self.dialogWidget)
         self.constrain_to_canvas_checkbox.checkStateChanged.connect(self.__switchConstrainToCanvas)
         self.constrain_to_canvas_checkbox.setToolTip("""Constrain to canvas
@@ -160,6 +272,11 @@ class BrushSFXExtension(Extension):
         self.dialogWidget.layout().addWidget(self.SFX_checkbox)
         self.dialogWidget.layout().addWidget(self.tool_detection_checkbox)
         self.dialogWidget.layout().addWidget(self.constrain_to_canvas_checkbox)
+        self.dialogWidget.layout().addWidget(self.warm_standby_checkbox)
+        self.dialogWidget.layout().addLayout(filter_backend_layout)
+        self.dialogWidget.layout().addLayout(stream_layout)
+        self.dialogWidget.layout().addLayout(idle_suspend_layout)
+        self.dialogWidget.layout().addLayout(crossfade_layout)
         self.dialogWidget.layout().addLayout(volume_layout)
         self.dialogWidget.layout().addWidget(self.general_config_widget)
         self.dialogWidget.layout().addWidget(self.current_preset_group)
@@ -170,13 +287,20 @@ class BrushSFXExtension(Extension):
         if state == Qt.CheckState.Checked or state == True:
             Krita.instance().writeSetting("BrushSfx", "brush_sfx_on", "True")
             self.is_sfx_on = True
-            self.player.startPlaying()
+            self.player.setStandby(False)
+            if not self.player.isPlaying():
+                self.player.startPlaying()
             self.input_listener.startListening()
         else:
             Krita.instance().writeSetting("BrushSfx", "brush_sfx_on", "False")
             self.is_sfx_on = False
-            self.player.stopPlaying()
-            self.input_listener.stopListening()
+            if self.__warm_standby:
+                # the stream and the event filter stay, so turning sound back on is instant
+                self.player.setStandby(True)
+                self.input_listener.pauseListening()
+            else:
+                self.player.stopPlaying()
+                self.input_listener.stopListening()
     
     def __switchToolDetection(self, state):
         if state == Qt.CheckState.Checked or state == True:
@@ -189,6 +313,17 @@ class BrushSFXExtension(Extension):
         
         self.player.setUseToolDetection(self.__using_tool_detection)
 
+    def __switchWarmStandby(self, state):
+        if state == Qt.CheckState.Checked or state == True:
+            Krita.instance().writeSetting("BrushSfx", "warm_standby", "True")
+            self.__warm_standby = True
+        else:
+            Krita.instance().writeSetting("BrushSfx", "warm_standby", "False")
+            self.__warm_standby = False
+            if not self.is_sfx_on:
+                self.player.stopPlaying()
+                self.input_listener.stopListening()
+
     def __switchConstrainToCanvas(self, state):
         if state == Qt.CheckState.Checked or state == True:
             Krita.instance().writeSetting("BrushSfx", "constrain_to_canvas", "True")
@@ -200,6 +335,55 @@ class BrushSFXExtension(Extension):
         
         self.input_listener.setConstrainToCanvas(self.__constrain_to_canvas)
 
+    def __filterBackendChanged(self, index):
+        if index < 0 or index >= len(self.__filter_backend_options):
+            return
+        self.__filter_backend = self.__filter_backend_options[index]
+        Krita.instance().writeSetting("BrushSfx", "filter_backend", self.__filter_backend)
+        self.wavetable_anchors_sb.setEnabled(self.__filter_backend == FILTER_BACKEND_WAVETABLE)
+        self.__refreshFilterBackendOfSources()
+
+    def __wavetableAnchorsChanged(self, anchors):
+        self.__wavetable_anchors = anchors
+        Krita.instance().writeSetting("BrushSfx", "wavetable_anchors", str(anchors))
+        self.__refreshFilterBackendOfSources()
+
+    def __blocksizeChanged(self, index):
+        if index < 0 or index >= len(BLOCK_SIZES):
+            return
+        self.__blocksize = BLOCK_SIZES[index]
+        Krita.instance().writeSetting("BrushSfx", "blocksize", str(self.__blocksize))
+        self.player.setStreamSettings(self.__blocksize, self.__latency)
+
+    def __latencyChanged(self, index):
+        if index < 0 or index >= len(self.__latency_options):
+            return
+        self.__latency = self.__latency_options[index]
+        Krita.instance().writeSetting("BrushSfx", "latency", self.__latency)
+        self.player.setStreamSettings(self.__blocksize, self.__latency)
+
+    def __idleSuspendChanged(self, seconds):
+        self.__idle_suspend_seconds = seconds
+        Krita.instance().writeSetting("BrushSfx", "idle_suspend_seconds", str(seconds))
+        self.player.setIdleSuspendSeconds(self.__idle_suspend_seconds)
+
+    def __crossfadeChanged(self, milliseconds):
+        self.__crossfade_ms = milliseconds
+        Krita.instance().writeSetting("BrushSfx", "crossfade_ms", str(milliseconds))
+        self.player.mixer.setCrossfadeSeconds(self.__crossfade_ms / 1000)
+
+    def __refreshFilterBackendOfSources(self):
+        filter_backend = self.__filter_backend
+        wavetable_anchors = self.__wavetable_anchors
+        def refresh_source(future):
+            if future.exception() is None:
+                self.source_factory.submit(lambda: future.result().set_filter_backend(filter_backend, wavetable_anchors))
+
+        # sources still being built get refreshed as soon as they are done
+        for sfx_option in self.__sound_options:
+            if sfx_option["sound_source_future"] is not None:
+                sfx_option["sound_source_future"].add_done_callback(refresh_source)
+
     ## Object __________________________________________________________________________________
     def __changeGeneralConfig(self, sfx_config):
         actual_volume = self.general_sfx_config.volume
@@ -261,12 +445,8 @@ class BrushSFXExtension(Extension):
             self.sfx_config_in_use.sfx_id = sfx_to_use.sfx_id
             sfx_option = self.__getSoundChoiceById(self.sfx_config_in_use.sfx_id)
             if sfx_option is not None:
-                if sfx_option["remain_cached"]:
-                    if sfx_option["sound_sorce_cache"] is None:
-                        sfx_option["sound_sorce_cache"] = sfx_option["sound_source_class"]()
-                    self.soundChanged.emit(sfx_option["sound_sorce_cache"])
-                else:
-                    self.soundChanged.emit(sfx_option["sound_source_class"]())
+                self.__useSoundSource(sfx_option, self.soundChanged.emit,
+                                      lambda: self.sfx_config_in_use.sfx_id == sfx_option["sfx_id"])
         
         self.sfx_config_in_use.use_eraser = sfx_to_use.use_eraser
         self.player.enableUseEraser(self.sfx_config_in_use.use_eraser)
@@ -275,12 +455,43 @@ class BrushSFXExtension(Extension):
             self.sfx_config_in_use.eraser_sfx_id = sfx_to_use.eraser_sfx_id
             sfx_option = self.__getSoundChoiceById(self.sfx_config_in_use.eraser_sfx_id)
             if sfx_option is not None:
-                if sfx_option["remain_cached"]:
-                    if sfx_option["sound_sorce_cache"] is None:
-                        sfx_option["sound_sorce_cache"] = sfx_option["sound_source_class"]()
-                    self.player.setEraserSoundSource(sfx_option["sound_sorce_cache"])
-                else:
-                    self.player.setEraserSoundSource(sfx_option["sound_source_class"]())
+                self.__useSoundSource(sfx_option, self.player.setEraserSoundSource,
+                                      lambda: self.sfx_config_in_use.eraser_sfx_id == sfx_option["sfx_id"])
+
+    def __useSoundSource(self, sfx_option, use_source, is_still_wanted):
+        """
+        The previous source keeps playing until the new one is built
+        """
+        future = self.__getSoundSource(sfx_option)
+        if future.done():
+            self.__onSoundSourceBuilt(future, use_source, is_still_wanted)
+        else:
+            self.source_factory.promote(future)
+            # emitted from the builder thread, the slot runs on the GUI thread
+            future.add_done_callback(lambda future: self.soundSourceBuilt.emit(future, use_source, is_still_wanted))
+
+    def __onSoundSourceBuilt(self, future, use_source, is_still_wanted):
+        if future.exception() is None and is_still_wanted():
+            use_source(future.result())
+
+    def __getSoundSource(self, sfx_option, prefetch = False):
+        if sfx_option["remain_cached"] and sfx_option["sound_source_future"] is not None:
+            return sfx_option["sound_source_future"]
+
+        def build():
+            sound_source = sfx_option["sound_source_class"](self.player.samplerate())
+            sound_source.set_filter_backend(self.__filter_backend, self.__wavetable_anchors)
+            return sound_source
+
+        future = self.source_factory.submit(build, prefetch)
+        if sfx_option["remain_cached"]:
+            sfx_option["sound_source_future"] = future
+        return future
+
+    def __prefetchSoundSources(self):
+        for sfx_option in self.__sound_options:
+            if sfx_option["remain_cached"]:
+                self.__getSoundSource(sfx_option, prefetch = True)
     # PRESET ________________________________________________________________________
  
     def __onPresetChange(self, preset):
@@ -342,6 +553,46 @@ class BrushSFXExtension(Extension):
         self.__constrain_to_canvas = __constrain_to_canvas != "False"
         self.input_listener.setConstrainToCanvas(self.__constrain_to_canvas)
 
+        __warm_standby_setting = Krita.instance().readSetting("BrushSfx", "warm_standby", "True")
+        self.__warm_standby = __warm_standby_setting != "False"
+
+        __filter_backend_setting = Krita.instance().readSetting("BrushSfx", "filter_backend", DEFAULT_FILTER_BACKEND)
+        if __filter_backend_setting not in self.__filter_backend_options:
+            __filter_backend_setting = FILTER_BACKEND_FFT
+        self.__filter_backend = __filter_backend_setting
+
+        __wavetable_anchors_setting = Krita.instance().readSetting("BrushSfx", "wavetable_anchors", str(DEFAULT_WAVETABLE_ANCHORS))
+        if __wavetable_anchors_setting.isdigit():
+            self.__wavetable_anchors = clamp(int(__wavetable_anchors_setting), 2, 64)
+        else:
+            self.__wavetable_anchors = DEFAULT_WAVETABLE_ANCHORS
+
+        __blocksize_setting = Krita.instance().readSetting("BrushSfx", "blocksize", str(DEFAULT_BLOCKSIZE))
+        if __blocksize_setting.isdigit() and int(__blocksize_setting) in BLOCK_SIZES:
+            self.__blocksize = int(__blocksize_setting)
+        else:
+            self.__blocksize = DEFAULT_BLOCKSIZE
+
+        __latency_setting = Krita.instance().readSetting("BrushSfx", "latency", DEFAULT_LATENCY)
+        if __latency_setting not in self.__latency_options:
+            __latency_setting = DEFAULT_LATENCY
+        self.__latency = __latency_setting
+        self.player.setStreamSettings(self.__blocksize, self.__latency)
+
+        __idle_suspend_setting = Krita.instance().readSetting("BrushSfx", "idle_suspend_seconds", str(DEFAULT_IDLE_SUSPEND_SECONDS))
+        if __idle_suspend_setting.isdigit():
+            self.__idle_suspend_seconds = clamp(int(__idle_suspend_setting), 0, 600)
+        else:
+            self.__idle_suspend_seconds = DEFAULT_IDLE_SUSPEND_SECONDS
+        self.player.setIdleSuspendSeconds(self.__idle_suspend_seconds)
+
+        __crossfade_setting = Krita.instance().readSetting("BrushSfx", "crossfade_ms", str(int(DEFAULT_CROSSFADE_SECONDS * 1000)))
+        if __crossfade_setting.isdigit():
+            self.__crossfade_ms = clamp(int(__crossfade_setting), 0, 1000)
+        else:
+            self.__crossfade_ms = int(DEFAULT_CROSSFADE_SECONDS * 1000)
+        self.player.mixer.setCrossfadeSeconds(self.__crossfade_ms / 1000)
+
         __volume_setting = Krita.instance().readSetting("BrushSfx", "volume",  str(DEFAULT_VOLUME))
         if __volume_setting.isdigit():
             __volume_setting = clamp(int(__volume_setting), 0, 100)
@@ -367,6 +618,26 @@ class BrushSFXExtension(Extension):
         self.SFX_checkbox.setCheckState(Qt.CheckState.Checked if self.is_sfx_on else Qt.CheckState.Unchecked)
         self.tool_detection_checkbox.setCheckState(Qt.CheckState.Checked if self.__using_tool_detection else Qt.CheckState.Unchecked)
         self.constrain_to_canvas_checkbox.setCheckState(Qt.CheckState.Checked if self.__constrain_to_canvas else Qt.CheckState.Unchecked)
+        self.warm_standby_checkbox.setCheckState(Qt.CheckState.Checked if self.__warm_standby else Qt.CheckState.Unchecked)
+        self.filter_backend_cb.blockSignals(True)
+        self.filter_backend_cb.setCurrentIndex(self.__filter_backend_options.index(self.__filter_backend))
+        self.filter_backend_cb.blockSignals(False)
+        self.wavetable_anchors_sb.blockSignals(True)
+        self.wavetable_anchors_sb.setValue(self.__wavetable_anchors)
+        self.wavetable_anchors_sb.setEnabled(self.__filter_backend == FILTER_BACKEND_WAVETABLE)
+        self.wavetable_anchors_sb.blockSignals(False)
+        self.blocksize_cb.blockSignals(True)
+        self.blocksize_cb.setCurrentIndex(BLOCK_SIZES.index(self.__blocksize))
+        self.blocksize_cb.blockSignals(False)
+        self.latency_cb.blockSignals(True)
+        self.latency_cb.setCurrentIndex(self.__latency_options.index(self.__latency))
+        self.latency_cb.blockSignals(False)
+        self.idle_suspend_sb.blockSignals(True)
+        self.idle_suspend_sb.setValue(self.__idle_suspend_seconds)
+        self.idle_suspend_sb.blockSignals(False)
+        self.crossfade_sb.blockSignals(True)
+        self.crossfade_sb.setValue(self.__crossfade_ms)
+        self.crossfade_sb.blockSignals(False)
         self.general_config_widget.blockSignals(True)
         self.general_config_widget.setOptionsData(self.__sound_options)
         self.general_config_widget.setSfxConfig(self.general_sfx_config)
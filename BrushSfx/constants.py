@@ -4,9 +4,33 @@ plugin_version = "1.1.9"
 config_version = "v1"
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
-BLOCKSIZE = 1000
+# rate of the output stream, every source renders at it
+DEFAULT_SAMPLERATE = 48000
+
+# frames rendered per callback, powers of two so the filter frames stay fast to transform.
+# A variable block size lets the audio device pick the size of each callback,
+# the fourier transform filters then hop by VARIABLE_BLOCKSIZE_HOP frames
+VARIABLE_BLOCKSIZE = 0
+VARIABLE_BLOCKSIZE_HOP = 512
+BLOCK_SIZES = [VARIABLE_BLOCKSIZE, 128, 256, 512, 1024, 2048]
+DEFAULT_BLOCKSIZE = 1024
+
+# latency profiles of the output stream, as understood by sounddevice
+LATENCY_LOW = "low"
+LATENCY_HIGH = "high"
+LATENCY_PROFILES = [LATENCY_LOW, LATENCY_HIGH]
+DEFAULT_LATENCY = LATENCY_LOW
 
 DEFAULT_SFX_ID = "bsfx_pencil"
 DEFAULT_USE_ERASER = True
 DEFAULT_ERASER_SFX_ID = "bsfx_eraser"
 DEFAULT_VOLUME = 100
+DEFAULT_MAX_VOICES = 4
+DEFAULT_IDLE_SUSPEND_SECONDS = 30
+DEFAULT_CROSSFADE_SECONDS = 0.05
+
+FILTER_BACKEND_FFT = "fft"
+FILTER_BACKEND_BIQUAD = "biquad"
+FILTER_BACKEND_WAVETABLE = "wavetable"
+DEFAULT_FILTER_BACKEND = FILTER_BACKEND_FFT
+DEFAULT_WAVETABLE_ANCHORS = 16
@@ -0,0 +1,365 @@
+import numpy as np
+
+from .utils import clamp, UnitRamp
+from .constants import FILTER_BACKEND_FFT, FILTER_BACKEND_BIQUAD, FILTER_BACKEND_WAVETABLE, DEFAULT_WAVETABLE_ANCHORS, \
+DEFAULT_BLOCKSIZE, VARIABLE_BLOCKSIZE, VARIABLE_BLOCKSIZE_HOP
+from .filter import apply_filter, StreamingFilter, StreamingBiquadFilter, filter_mask_cache, biquad_sections
+
+class LoopReader:
+    """
+    Reads blocks from a looping buffer without copying the whole loop.
+    The returned block is a view of the loop, or of a buffer reused by the next read, so it must not be modified
+    """
+    def __init__(self, samples: np.ndarray):
+        self.__samples = samples
+        self.__cursor = 0
+        self.__seam = np.zeros(0, dtype=samples.dtype)
+
+    @property
+    def samples(self) -> np.ndarray:
+        return self.__samples
+
+    def read(self, count: int) -> np.ndarray:
+        size = self.__samples.size
+        start = self.__cursor
+        end = start + count
+        self.__cursor = (start + count) % size
+
+        if end <= size:
+            return self.__samples[start:end]
+
+        # only the blocks crossing the seam get copied
+        if self.__seam.size < count:
+            self.__seam = np.zeros(count, dtype=self.__samples.dtype)
+        seam = self.__seam[:count]
+        written = 0
+        while written < count:
+            taken = min(size - start, count - written)
+            seam[written:written + taken] = self.__samples[start:start + taken]
+            written += taken
+            start = 0
+        return seam
+
+class WavetableBank:
+    """
+    A loop pre-rendered through a filter chain at evenly spaced anchors of its parameter (from 0 to 1).
+    Playback crossfades the two tables nearest to the parameter, so nothing is filtered in realtime
+    """
+    def __init__(self, samples: np.ndarray, samplerate: int, anchors: int, build_filters):
+        self.anchors = max(2, anchors)
+        frequencies = np.fft.rfftfreq(samples.size, d=1/samplerate).astype(np.float32)
+        self.__tables = np.array([
+            apply_filter(samples, samplerate, frequencies, build_filters(anchor))
+            for anchor in np.linspace(0.0, 1.0, self.anchors)
+        ])
+        self.__cursor = 0
+        self.__weights = np.zeros(self.anchors, dtype=np.float32)
+        self.__last_weights = np.zeros(self.anchors, dtype=np.float32)
+        self.__ramp = UnitRamp()
+        self.__table_weight = np.zeros(0, dtype=np.float32)
+
+    def process(self, frames: int, parameter: float, gain: float, out: np.ndarray = None) -> np.ndarray:
+        """
+        the output is written to out when given
+        """
+        if out is None:
+            out = np.zeros(frames, dtype=np.float32)
+        if self.__table_weight.size < frames:
+            self.__table_weight = np.zeros(frames, dtype=np.float32)
+        ramp = self.__ramp.get(frames)
+
+        position = clamp(parameter, 0.0, 1.0) * (self.anchors - 1)
+        index = min(int(position), self.anchors - 2)
+        blend = position - index
+        weights = self.__weights
+        weights.fill(0.0)
+        weights[index] = (1.0 - blend) * gain
+        weights[index + 1] = blend * gain
+
+        size = self.__tables.shape[1]
+        start = self.__cursor
+        self.__cursor = (start + frames) % size
+
+        # weights are ramped from the last block so moving between tables doesn't click
+        out.fill(0.0)
+        table_weight = self.__table_weight[:frames]
+        for table in range(self.anchors):
+            if weights[table] == 0 and self.__last_weights[table] == 0:
+                continue
+            np.multiply(ramp, weights[table] - self.__last_weights[table], out=table_weight)
+            table_weight += self.__last_weights[table]
+            written = 0
+            position = start
+            while written < frames:
+                taken = min(size - position, frames - written)
+                table_weight[written:written + taken] *= self.__tables[table, position:position + taken]
+                written += taken
+                position = 0
+            out += table_weight
+
+        self.__weights, self.__last_weights = self.__last_weights, self.__weights
+        return out
+
+
+class Node:
+    """
+    A step of the sound of a source. Nodes only describe the graph, DSPGraph keeps their state
+    so the same description can be rendered by more than one graph
+    """
+    def __init__(self, *inputs: "Node"):
+        self.inputs = list(inputs)
+
+class LoopNode(Node):
+    """
+    plays samples in a loop
+    """
+    def __init__(self, samples: np.ndarray):
+        super().__init__()
+        self.samples = samples
+
+class FilterNode(Node):
+    """
+    filters a loop with the filters returned by build_filters(*parameters[chain_id]),
+    parameters must range from 0 to 1. The filter plays the loop from its own position
+    """
+    def __init__(self, loop: LoopNode, chain_id: str, build_filters):
+        if not isinstance(loop, LoopNode):
+            raise Exception("FilterNode can only filter a LoopNode")
+        super().__init__(loop)
+        self.chain_id = chain_id
+        self.build_filters = build_filters
+
+class GainNode(Node):
+    """
+    multiplies its input by parameters[parameter]
+    """
+    def __init__(self, node: Node, parameter: str):
+        super().__init__(node)
+        self.parameter = parameter
+
+class MixNode(Node):
+    """
+    adds its inputs together
+    """
+    def __init__(self, *inputs: Node):
+        if len(inputs) == 0:
+            raise Exception("MixNode needs at least one input")
+        super().__init__(*inputs)
+
+
+class _FilterStage:
+    """
+    state of a FilterNode, one engine for each filter backend
+    """
+    def __init__(self, node: FilterNode, samplerate: int, blocksize: int):
+        self.node = node
+        self.reader = LoopReader(node.inputs[0].samples)
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.backend = FILTER_BACKEND_FFT
+        self.wavetable_anchors = DEFAULT_WAVETABLE_ANCHORS
+        self.__fft_filter = None
+        self.__biquad_filter = None
+        self.__wavetable_bank = None
+
+    def set_backend(self, backend: str, wavetable_anchors: int):
+        if wavetable_anchors != self.wavetable_anchors:
+            self.wavetable_anchors = wavetable_anchors
+            self.__wavetable_bank = None
+        if backend == FILTER_BACKEND_WAVETABLE and self.__wavetable_bank is None:
+            self.__wavetable_bank = WavetableBank(self.node.inputs[0].samples, self.samplerate,
+                                                  self.wavetable_anchors, self.node.build_filters)
+        self.backend = backend
+
+    def __hop(self) -> int:
+        return self.blocksize if self.blocksize != VARIABLE_BLOCKSIZE else VARIABLE_BLOCKSIZE_HOP
+
+    def set_blocksize(self, blocksize: int):
+        if blocksize == self.blocksize:
+            return
+        self.blocksize = blocksize
+        if self.__fft_filter is not None:
+            self.__fft_filter = StreamingFilter(self.__hop(), self.samplerate)
+
+    def process(self, out: np.ndarray, gain: float, parameters: tuple) -> np.ndarray:
+        frames = out.size
+        build_filters = self.node.build_filters
+        if self.backend == FILTER_BACKEND_WAVETABLE and self.__wavetable_bank is not None:
+            return self.__wavetable_bank.process(frames, parameters[0], gain, out)
+
+        if self.backend == FILTER_BACKEND_BIQUAD:
+            if self.__biquad_filter is None:
+                self.__biquad_filter = StreamingBiquadFilter()
+            sections = biquad_sections(build_filters(*parameters), self.samplerate)
+            return self.__biquad_filter.process(frames, self.reader.read, gain, sections, out)
+
+        if self.__fft_filter is None:
+            self.__fft_filter = StreamingFilter(self.__hop(), self.samplerate)
+        mask = filter_mask_cache.get(self.node.chain_id, parameters, self.__fft_filter.frequencies, build_filters)
+        return self.__fft_filter.process(frames, self.reader.read, gain, mask, out)
+
+class _SharedBuffer:
+    """
+    output of a node used by more than one other node, rendered once per block
+    """
+    def __init__(self):
+        self.block = -1
+        self.samples = np.zeros(0, dtype=np.float32)
+
+class DSPGraph:
+    """
+    Renders a graph of nodes one block at a time, straight into the output buffer.
+    Consecutive gains are multiplied together and applied in one pass, and a gain that stays the same for the whole
+    block is given to the filter under it instead. Identical filters of the same loop are merged, and nodes used
+    by more than one other node are rendered once per block. Intermediate buffers are kept between blocks.
+    smooth(parameter, value, frames) turns a parameter into the per sample values or the scalar used for the block
+    """
+    def __init__(self, output: Node, samplerate: int, smooth=None, blocksize: int = DEFAULT_BLOCKSIZE):
+        self.output = output
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.__smooth = smooth if smooth is not None else lambda parameter, value, frames: value
+
+        self.__canonical = {}
+        self.__merged_filters = {}
+        self.__loops = {}
+        self.__filters = {}
+        self.__shared = {}
+        self.__buffers = []
+        self.__buffers_in_use = 0
+        self.__block = 0
+
+        uses = {}
+        self.__compile(output, uses)
+        for node_id, count in uses.items():
+            if count > 1:
+                self.__shared[node_id] = _SharedBuffer()
+
+    def __compile(self, node: Node, uses: dict):
+        node = self.__node(node)
+        uses[id(node)] = uses.get(id(node), 0) + 1
+        if uses[id(node)] > 1:
+            return
+
+        if isinstance(node, LoopNode):
+            self.__loops[id(node)] = LoopReader(node.samples)
+        elif isinstance(node, FilterNode):
+            self.__filters[id(node)] = _FilterStage(node, self.samplerate, self.blocksize)
+        else:
+            for node_input in node.inputs:
+                self.__compile(node_input, uses)
+
+    def __node(self, node: Node) -> Node:
+        """
+        the node rendered in place of node, the same filter on the same loop is only rendered once
+        """
+        canonical = self.__canonical.get(id(node))
+        if canonical is None:
+            canonical = node
+            if isinstance(node, FilterNode):
+                canonical = self.__merged_filters.setdefault((id(node.inputs[0]), node.chain_id), node)
+            self.__canonical[id(node)] = canonical
+        return canonical
+
+    def set_filter_backend(self, backend: str, wavetable_anchors: int):
+        """
+        the wavetable backend renders its tables here, so this should not be called from the audio thread
+        """
+        for stage in self.__filters.values():
+            stage.set_backend(backend, wavetable_anchors)
+
+    def set_blocksize(self, blocksize: int):
+        """
+        the fourier transform filters hop one block at a time and are rebuilt for the new size,
+        so this should not be called while the graph is rendering. With VARIABLE_BLOCKSIZE any size can be rendered
+        """
+        self.blocksize = blocksize
+        for stage in self.__filters.values():
+            stage.set_blocksize(blocksize)
+        self.__buffers = []
+
+    def render(self, out: np.ndarray, parameters: dict) -> np.ndarray:
+        """
+        renders the next out.size frames into out, parameters maps the parameter of each GainNode to its value
+        and the chain_id of each FilterNode to the tuple its filters are built from
+        """
+        self.__block += 1
+        self.__render(self.output, out, parameters)
+        return out
+
+    def __acquire_buffer(self, frames: int) -> np.ndarray:
+        # buffers only grow, blocks of other sizes use the start of them
+        if self.__buffers_in_use == len(self.__buffers):
+            self.__buffers.append(np.zeros(frames, dtype=np.float32))
+        buffer = self.__buffers[self.__buffers_in_use]
+        if buffer.size < frames:
+            buffer = np.zeros(frames, dtype=np.float32)
+            self.__buffers[self.__buffers_in_use] = buffer
+        self.__buffers_in_use += 1
+        return buffer[:frames]
+
+    def __release_buffer(self):
+        self.__buffers_in_use -= 1
+
+    def __render(self, node: Node, out: np.ndarray, parameters: dict):
+        node = self.__node(node)
+        shared = self.__shared.get(id(node))
+        if shared is None:
+            self.__render_node(node, out, parameters)
+            return
+
+        samples = shared.samples[:out.size]
+        if shared.block != self.__block:
+            if shared.samples.size < out.size:
+                shared.samples = np.zeros(out.size, dtype=np.float32)
+                samples = shared.samples
+            self.__render_node(node, samples, parameters)
+            shared.block = self.__block
+        out[:] = samples
+
+    def __render_node(self, node: Node, out: np.ndarray, parameters: dict):
+        if isinstance(node, LoopNode):
+            out[:] = self.__loops[id(node)].read(out.size)
+        elif isinstance(node, FilterNode):
+            self.__filters[id(node)].process(out, 1.0, parameters.get(node.chain_id, ()))
+        elif isinstance(node, GainNode):
+            self.__render_gain(node, out, parameters)
+        elif isinstance(node, MixNode):
+            self.__render(node.inputs[0], out, parameters)
+            mixed = self.__acquire_buffer(out.size)
+            for node_input in node.inputs[1:]:
+                self.__render(node_input, mixed, parameters)
+                out += mixed
+            self.__release_buffer()
+        else:
+            raise Exception(f"{node.__class__.__name__} can't be rendered")
+
+    def __render_gain(self, node: GainNode, out: np.ndarray, parameters: dict):
+        frames = out.size
+        gain = 1.0
+        ramp = None
+        ramp_buffer = self.__acquire_buffer(frames)
+        # consecutive gains are multiplied together before touching the samples
+        while isinstance(node, GainNode):
+            value = self.__smooth(node.parameter, parameters[node.parameter], frames)
+            if np.ndim(value) == 0:
+                gain *= value
+            elif ramp is None:
+                ramp = value
+            else:
+                np.multiply(ramp, value, out=ramp_buffer)
+                ramp = ramp_buffer
+            node = self.__node(node.inputs[0])
+        if ramp is not None and gain != 1.0:
+            np.multiply(ramp, gain, out=ramp_buffer)
+            ramp = ramp_buffer
+
+        is_shared = id(node) in self.__shared
+        if ramp is None and isinstance(node, FilterNode) and not is_shared:
+            self.__filters[id(node)].process(out, gain, parameters.get(node.chain_id, ()))
+        elif isinstance(node, LoopNode) and not is_shared:
+            np.multiply(self.__loops[id(node)].read(frames), gain if ramp is None else ramp, out=out)
+        else:
+            self.__render(node, out, parameters)
+            out *= gain if ramp is None else ramp
+        self.__release_buffer()
@@ -1,43 +1,55 @@
 from typing import List
+from collections import OrderedDict
+import math
 
-from .utils import clamp, smooth_lerp, smooth_lerp_array
+from .utils import smooth_lerp_array, UnitRamp, clamp
 
 import numpy as np
 
 class Filter:
+    """
+    Filters work on one sided spectra, frequencies are expected to come from np.fft.rfftfreq.
+    Audio goes through the plugin as float32, so frequencies and responses should be float32 too
+    """
     def __init__(self):
         pass
 
+    def response(self, frequencies: np.ndarray) -> np.ndarray:
+        """
+        multiplicative gain of the filter for each frequency
+        """
+        return np.ones(frequencies.size, dtype=np.float32)
+
     def apply(self, fourier: np.ndarray, frequencies: np.ndarray):
         if fourier.size != frequencies.size:
             raise Exception("list of frequencies doesnt match with the fourier transformation")
+        fourier *= self.response(frequencies)
 
 class LowPassFilter(Filter):
     def __init__(self, pass_freq, cutoff):
         self.pass_freq = pass_freq
         self.cutoff = cutoff
 
-    def apply(self, fourier: np.ndarray, frequencies: np.ndarray):
-        super().apply(fourier, frequencies)
+    def __repr__(self):
+        return f"LowPassFilter({self.pass_freq}, {self.cutoff})"
+
+    def response(self, frequencies: np.ndarray) -> np.ndarray:
         smooth =  self.cutoff - self.pass_freq
-        freq_abs = np.abs(frequencies)
-        distance_from_cutoff = (self.cutoff - freq_abs) / smooth
-        distance_smoothed = smooth_lerp_array(distance_from_cutoff, 0.0, 1.0)
-        fourier[:] *= distance_smoothed
+        distance_from_cutoff = (self.cutoff - frequencies) / smooth
+        return smooth_lerp_array(distance_from_cutoff, 0.0, 1.0)
 
 class HighPassFilter(Filter):
     def __init__(self, pass_freq, cutoff):
         self.pass_freq = pass_freq
         self.cutoff = cutoff
 
-    def apply(self, fourier: np.ndarray, frequencies: np.ndarray):
-        super().apply(fourier, frequencies)
+    def __repr__(self):
+        return f"HighPassFilter({self.pass_freq}, {self.cutoff})"
 
+    def response(self, frequencies: np.ndarray) -> np.ndarray:
         smooth =  self.pass_freq - self.cutoff
-        freq_abs = np.abs(frequencies)
-        distance_from_cutoff = (freq_abs - self.cutoff) / smooth
-        distance_smoothed = smooth_lerp(distance_from_cutoff, 0.0, 1.0)
-        fourier[:] *= distance_smoothed
+        distance_from_cutoff = (frequencies - self.cutoff) / smooth
+        return smooth_lerp_array(distance_from_cutoff, 0.0, 1.0)
 
 
 class PeakFilter(Filter):
@@ -52,24 +64,365 @@ class PeakFilter(Filter):
             raise Exception("Invalid values for PeakFilter")
         self.gain = gain
 
-    def apply(self, fourier: np.ndarray, frequencies: np.ndarray):
-        super().apply(fourier, frequencies)
+    def __repr__(self):
+        return f"PeakFilter({self.lower_target}, {self.lower_smooth}, {self.higher_smooth}, {self.higher_target}, {self.gain})"
 
-        freq_abs = np.absolute(frequencies)
-        distance_from_lower = (freq_abs - self.lower_target) / ((self.lower_smooth - self.lower_target) + 0.0001)
-        distance_from_higer = (self.higher_target - freq_abs) / ((self.higher_target - self.higher_smooth) + 0.0001)
+    def response(self, frequencies: np.ndarray) -> np.ndarray:
+        distance_from_lower = (frequencies - self.lower_target) / ((self.lower_smooth - self.lower_target) + 0.0001)
+        distance_from_higer = (self.higher_target - frequencies) / ((self.higher_target - self.higher_smooth) + 0.0001)
         distance_from_target = smooth_lerp_array(np.minimum(distance_from_lower, distance_from_higer), 0, 1)
-        fourier[:] += (self.gain * fourier * distance_from_target)
-        
+        distance_from_target *= self.gain
+        distance_from_target += 1.0
+        return distance_from_target
+
+
+class FilterChain:
+    """
+    Composes a list of filters into a single multiplicative response, so the whole chain
+    is applied to a spectrum with one multiplication.
+    The response is computed once for each list of frequencies it is used with
+    """
+    def __init__(self, filters: List[Filter]):
+        self.filters = list(filters)
+        self.__responses = {}
+
+    def __repr__(self):
+        return f"FilterChain({self.filters})"
+
+    def response(self, frequencies: np.ndarray) -> np.ndarray:
+        key = (frequencies.size, float(frequencies[1]))
+        response = self.__responses.get(key)
+        if response is None:
+            response = np.ones(frequencies.size, dtype=np.float32)
+            for filt in self.filters:
+                response *= filt.response(frequencies)
+            self.__responses[key] = response
+        return response
+
+    def apply(self, fourier: np.ndarray, frequencies: np.ndarray):
+        if fourier.size != frequencies.size:
+            raise Exception("list of frequencies doesnt match with the fourier transformation")
+        fourier *= self.response(frequencies)
+
+
+def apply_filter(samples, samplerate, frequencies_cache, filters):
+    """
+    filters can be a FilterChain or a list of filters
+    """
+    chain = filters if isinstance(filters, FilterChain) else FilterChain(filters)
+
+    fourier_to_filter = np.fft.rfft(samples)
+    chain.apply(fourier_to_filter, frequencies_cache)
+    samples_reconstruction = np.fft.irfft(fourier_to_filter, n=samples.size)
+
+    # numpy < 2 always transforms in double precision
+    return samples_reconstruction.astype(samples.dtype, copy=False)
+
+class FilterMaskCache:
+    """
+    Least recently used cache of the gain vector of filter chains.
+    Entries are keyed by the chain and the parameters its filters are built from,
+    those parameters should be quantized or the cache will never hit
+    """
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.__hits = 0
+        self.__misses = 0
+        self.__masks = OrderedDict()
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    def __len__(self):
+        return len(self.__masks)
+
+    def get(self, chain_id: str, parameters: tuple, frequencies: np.ndarray, build_filters) -> np.ndarray:
+        """
+        build_filters(*parameters) returns the FilterChain or the list of filters of the chain.
+        The returned mask is shared and must not be modified
+        """
+        key = (chain_id, parameters, frequencies.size, float(frequencies[1]))
+        mask = self.__masks.get(key)
+        if mask is not None:
+            self.__hits += 1
+            self.__masks.move_to_end(key)
+            return mask
+
+        self.__misses += 1
+        chain = build_filters(*parameters)
+        if not isinstance(chain, FilterChain):
+            chain = FilterChain(chain)
+        mask = chain.response(frequencies)
+        self.__masks[key] = mask
+        if len(self.__masks) > self.max_size:
+            self.__masks.popitem(last=False)
+        return mask
+
+    def clear(self):
+        self.__masks.clear()
+        self.__hits = 0
+        self.__misses = 0
+
+filter_mask_cache = FilterMaskCache()
 
+class StreamingFilter:
+    """
+    Overlap-add filtering of a continuous stream of samples.
+    Frames of 2*hop samples overlap by half and are windowed with a square root hann window on analysis and synthesis,
+    gain and filter mask are set per call and interpolated between the hops processed in it.
+    Every buffer is allocated here, so processing a block doesn't allocate anything
+    """
+    def __init__(self, hop: int, samplerate: int):
+        self.hop = hop
+        self.frame_size = hop * 2
+        self.frequencies = np.fft.rfftfreq(self.frame_size, d=1/samplerate).astype(np.float32)
 
-def apply_filter(samples, samplerate, frequencies_cache, filters: List[Filter]):
-    
-    fourier_to_filter = np.fft.fft(samples)
+        n = np.arange(self.frame_size)
+        self.__window = np.sqrt(0.5 - 0.5 * np.cos(2 * np.pi * n / self.frame_size)).astype(np.float32)
+        self.__window_squared = self.__window * self.__window
+        self.__flat_mask = np.ones(self.frequencies.size, dtype=np.float32)
 
+        self.__frame = np.zeros(self.frame_size, dtype=np.float32)
+        self.__windowed_frame = np.zeros(self.frame_size, dtype=np.float32)
+        self.__spectrum = np.zeros(self.frequencies.size, dtype=np.complex64)
+        self.__response = np.zeros(self.frequencies.size, dtype=np.float32)
+        self.__response_step = np.zeros(self.frequencies.size, dtype=np.float32)
+        self.__overlap = np.zeros(hop, dtype=np.float32)
+        self.__hop_output = np.zeros(hop, dtype=np.float32)
+        self.__output_fifo = np.zeros(hop, dtype=np.float32)
+        self.__fifo_size = 0
+
+        self.__last_gain = 0.0
+        self.__last_mask = None
+
+    def process(self, frames: int, read_samples, gain: float = 1.0, mask: np.ndarray = None,
+                out: np.ndarray = None) -> np.ndarray:
+        """
+        read_samples(count) is called to pull the input, one hop at a time.
+        The output is written to out when given
+        """
+        if out is None:
+            out = np.zeros(frames, dtype=np.float32)
+
+        written = min(frames, self.__fifo_size)
+        out[:written] = self.__output_fifo[:written]
+        self.__output_fifo[:self.__fifo_size - written] = self.__output_fifo[written:self.__fifo_size]
+        self.__fifo_size -= written
+
+        hops = max(0, -(-(frames - written) // self.hop))
+        for i in range(hops):
+            t = (i + 1) / hops
+            hop_output = self.__process_hop(read_samples(self.hop), self.__hop_response(t, gain, mask))
+            taken = min(self.hop, frames - written)
+            out[written:written + taken] = hop_output[:taken]
+            written += taken
+            # the part of the last hop that doesn't fit waits for the next call
+            self.__fifo_size = self.hop - taken
+            self.__output_fifo[:self.__fifo_size] = hop_output[taken:]
+
+        if hops > 0:
+            self.__last_gain = gain
+            self.__last_mask = mask
+        return out
+
+    def __hop_response(self, t: float, gain: float, mask: np.ndarray):
+        """
+        response of the filter interpolated from the last call, t goes from 0 to 1 over the hops of a call
+        """
+        if mask is None and self.__last_mask is None:
+            return self.__last_gain + ((gain - self.__last_gain) * t)
+
+        previous_mask = self.__flat_mask if self.__last_mask is None else self.__last_mask
+        current_mask = self.__flat_mask if mask is None else mask
+        np.multiply(previous_mask, self.__last_gain * (1.0 - t), out=self.__response)
+        np.multiply(current_mask, gain * t, out=self.__response_step)
+        self.__response += self.__response_step
+        return self.__response
+
+    def __process_hop(self, hop_samples: np.ndarray, response) -> np.ndarray:
+        self.__frame[:self.hop] = self.__frame[self.hop:]
+        self.__frame[self.hop:] = hop_samples
+
+        frame_output = self.__windowed_frame
+        if np.ndim(response) == 0:
+            # a flat response doesn't need to go through the fourier transform
+            np.multiply(self.__frame, self.__window_squared, out=frame_output)
+            frame_output *= response
+        else:
+            np.multiply(self.__frame, self.__window, out=frame_output)
+            np.fft.rfft(frame_output, out=self.__spectrum)
+            self.__spectrum *= response
+            np.fft.irfft(self.__spectrum, n=self.frame_size, out=frame_output)
+            frame_output *= self.__window
+
+        np.add(self.__overlap, frame_output[:self.hop], out=self.__hop_output)
+        self.__overlap[:] = frame_output[self.hop:]
+        return self.__hop_output
+
+
+def peak_biquad(peak: PeakFilter, samplerate: int) -> np.ndarray:
+    """
+    RBJ peaking equalizer with the same top gain as the PeakFilter, centered between its half gain points.
+    Against the PeakFilter responses of the sound sources, on a log frequency grid over 20Hz-20kHz, it is off by
+    up to 10.8 dB (2.3 dB RMS) for the pen, 3.9 dB (1.6 dB RMS) for the pencil and 1.9 dB (0.4 dB RMS) for the paint brush.
+    The biggest differences are right below steep lower edges, since a biquad can't fall that fast
+    """
+    lower_frequency = max((peak.lower_target + peak.lower_smooth) / 2, 1.0)
+    higher_frequency = max((peak.higher_smooth + peak.higher_target) / 2, lower_frequency + 1.0)
+    center = math.sqrt(lower_frequency * higher_frequency)
+    bandwidth = math.log2(higher_frequency / lower_frequency)
+
+    A = math.sqrt(max(1.0 + peak.gain, 0.001))
+    w0 = 2 * math.pi * min(center, samplerate * 0.49) / samplerate
+    alpha = math.sin(w0) * math.sinh(math.log(2) / 2 * bandwidth * w0 / math.sin(w0))
+    a0 = 1 + alpha / A
+    return np.array([
+        (1 + alpha * A) / a0, (-2 * math.cos(w0)) / a0, (1 - alpha * A) / a0,
+        1.0, (-2 * math.cos(w0)) / a0, (1 - alpha / A) / a0
+    ])
+
+def pass_biquad(pass_filter: Filter, samplerate: int) -> np.ndarray:
+    """
+    butterworth biquad with its cutoff between the pass frequency and the cutoff of the filter
+    """
+    cutoff = (pass_filter.pass_freq + pass_filter.cutoff) / 2
+    w0 = 2 * math.pi * min(max(cutoff, 1.0), samplerate * 0.49) / samplerate
+    alpha = math.sin(w0) / (2 * math.sqrt(0.5))
+    a0 = 1 + alpha
+    if isinstance(pass_filter, LowPassFilter):
+        b = [(1 - math.cos(w0)) / 2, 1 - math.cos(w0), (1 - math.cos(w0)) / 2]
+    else:
+        b = [(1 + math.cos(w0)) / 2, -(1 + math.cos(w0)), (1 + math.cos(w0)) / 2]
+    return np.array([b[0] / a0, b[1] / a0, b[2] / a0, 1.0, (-2 * math.cos(w0)) / a0, (1 - alpha) / a0])
+
+def biquad_sections(filters, samplerate: int) -> np.ndarray:
+    """
+    second order sections approximating a FilterChain or a list of filters
+    """
+    if isinstance(filters, FilterChain):
+        filters = filters.filters
+    sections = []
     for filt in filters:
-        filt.apply(fourier_to_filter, frequencies_cache)
+        if isinstance(filt, PeakFilter):
+            if filt.gain != 0:
+                sections += [peak_biquad(filt, samplerate)]
+        elif isinstance(filt, (LowPassFilter, HighPassFilter)):
+            sections += [pass_biquad(filt, samplerate)]
+        else:
+            raise Exception(f"{filt.__class__.__name__} has no biquad equivalent")
+    return np.array(sections, dtype=np.float32).reshape((len(sections), 6))
+
+def all_pole_response(a1: float, a2: float, frames: int) -> np.ndarray:
+    """
+    First frames samples of the impulse response of 1 / (1 + a1 z^-1 + a2 z^-2), from the poles of the section.
+    Complex poles r e^(+-i theta) give h[n] = r^n sin((n + 1) theta) / sin(theta),
+    real poles p1 and p2 = q p1 give h[n] = p1^n (1 - q^(n + 1)) / (1 - q), with expm1 so close poles stay precise
+    """
+    n = np.arange(frames)
+    discriminant = a1 * a1 - 4 * a2
+    if discriminant < 0:
+        radius = math.sqrt(a2)
+        theta = math.acos(clamp(-a1 / (2 * radius), -1.0, 1.0))
+        if math.sin(theta) > 1e-9:
+            return (radius ** n) * np.sin((n + 1) * theta) / math.sin(theta)
+
+    # the larger pole is found without cancelling a1 out, the smaller one from their product a2
+    larger_pole = (-a1 - math.copysign(math.sqrt(max(discriminant, 0.0)), a1)) / 2
+    if larger_pole == 0:
+        return (n == 0).astype(np.float64)
+    ratio = (a2 / larger_pole) / larger_pole
+    if ratio >= 1.0:
+        return (n + 1) * (larger_pole ** n)
+    if ratio > 0:
+        return (larger_pole ** n) * np.expm1((n + 1) * math.log(ratio)) / math.expm1(math.log(ratio))
+    return (larger_pole ** n) * (1.0 - ratio ** (n + 1)) / (1.0 - ratio)
+
+class SectionSpectrumCache:
+    """
+    Least recently used cache of the spectra of the impulse response of the poles of a section,
+    the sections of the sound sources come from quantized parameters so the same ones come back often
+    """
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self.__spectra = OrderedDict()
+
+    def get(self, a1: float, a2: float, frames: int, fft_size: int) -> np.ndarray:
+        key = (a1, a2, frames, fft_size)
+        spectrum = self.__spectra.get(key)
+        if spectrum is not None:
+            self.__spectra.move_to_end(key)
+            return spectrum
+        spectrum = np.fft.rfft(all_pole_response(a1, a2, frames), fft_size)
+        self.__spectra[key] = spectrum
+        if len(self.__spectra) > self.max_size:
+            self.__spectra.popitem(last=False)
+        return spectrum
+
+section_spectrum_cache = SectionSpectrumCache()
+
+def sosfilt(sections: np.ndarray, samples: np.ndarray, state: np.ndarray) -> np.ndarray:
+    """
+    Filters samples through the second order sections one after the other, like scipy.signal.sosfilt.
+    state holds the last two inputs and outputs of each section (x[-1], x[-2], y[-1], y[-2]) and is updated in place.
+    The poles are applied as an FFT convolution with their impulse response, which is exact within a block
+    since a sample only depends on the inputs before it, and the state of the poles enters as an input at its start
+    """
+    frames = samples.size
+    fft_size = 1 << (2 * frames - 1).bit_length()
+    signal = samples.astype(np.float64)
+    for i in range(sections.shape[0]):
+        b0, b1, b2, _, a1, a2 = (float(value) for value in sections[i])
+        x1, x2, y1, y2 = state[i]
+        # zeros of the section, with the inputs of the previous block
+        extended = np.concatenate(([x2, x1], signal))
+        section_input = b0 * extended[2:]
+        section_input += b1 * extended[1:-1]
+        section_input += b2 * extended[:-2]
+        section_input[0] -= (a1 * y1) + (a2 * y2)
+        if frames > 1:
+            section_input[1] -= a2 * y1
+        spectrum = np.fft.rfft(section_input, fft_size)
+        spectrum *= section_spectrum_cache.get(a1, a2, frames, fft_size)
+        output = np.fft.irfft(spectrum, fft_size)[:frames]
+        state[i] = (extended[-1], extended[-2], output[-1], output[-2] if frames > 1 else y1)
+        signal = output
+    return signal.astype(np.float32)
+
+class StreamingBiquadFilter:
+    """
+    Filters a continuous stream of samples with second order sections, carrying the filter state between calls.
+    Gain is ramped linearly from the previous call since there is no overlap to smooth it.
+    sosfilt returns a new array, the rest of the processing reuses its buffers
+    """
+    def __init__(self):
+        self.__state = np.zeros((0, 4))
+        self.__last_gain = 0.0
+        self.__unit_ramp = UnitRamp()
+
+    def process(self, frames: int, read_samples, gain: float = 1.0, sections: np.ndarray = None,
+                out: np.ndarray = None) -> np.ndarray:
+        """
+        the output is written to out when given
+        """
+        if out is None:
+            out = np.zeros(frames, dtype=np.float32)
 
-    samples_reconstruction = np.real(np.fft.ifft(fourier_to_filter))
+        samples = read_samples(frames)
+        if sections is not None and sections.shape[0] > 0:
+            if self.__state.shape[0] != sections.shape[0]:
+                self.__state = np.zeros((sections.shape[0], 4))
+            samples = sosfilt(sections, samples, self.__state)
+        else:
+            # the state belongs to input that is gone by the time the sections come back
+            self.__state.fill(0.0)
 
-    return samples_reconstruction
\ No newline at end of file
+        np.multiply(self.__unit_ramp.get(frames), gain - self.__last_gain, out=out)
+        out += self.__last_gain
+        out *= samples
+        self.__last_gain = gain
+        return out
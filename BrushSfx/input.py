@@ -6,20 +6,52 @@ from .Qt.QtWidgets import QApplication
 from .Qt import QtCompat
 from .Qt.QtCore import Qt, QObject, QEvent, QPoint, QTimer, Signal
 from .Qt.QtGui import QWindow
+from typing import NamedTuple, List
 import time
+import math
+
+import numpy as np
+
+from .utils import fill_piecewise_linear
+
+INPUT_HISTORY_SIZE = 256
+# an event time further than this behind the monotonic clock is taken as coming from another clock
+EVENT_CLOCK_RESET_SECONDS = 1.0
+
+class InputSnapshot(NamedTuple):
+    """
+    State of the input published by the event filter, never modified after that.
+    The stroke and hover distances add up every movement since the listener was created,
+    readers get the movement between two snapshots by subtracting them
+    """
+    x: int
+    y: int
+    pressure: float
+    is_pressing: bool
+    is_over_canvas: bool
+    timestamp: float
+    stroke_distance_x: int
+    stroke_distance_y: int
+    hover_distance_x: int
+    hover_distance_y: int
 
 class InputListener(QObject):
     canvasClicked = Signal()
+    # every new snapshot, hovering included
+    inputPublished = Signal()
 
     def __init__(self):
         super().__init__()
         
         self.__constrain_to_canvas = True
         self.__is_listening = False
+        self.__is_paused = False
 
         self.__is_pressing = False
         self.__cursor_potition = QPoint(0, 0)
-        self.__last_cursor_position_read = QPoint(0, 0)
+        self.__hover_position = QPoint(0, 0)
+        self.__stroke_distance = QPoint(0, 0)
+        self.__hover_distance = QPoint(0, 0)
         self.__pressure = 0.0
         self.__is_tablet_input = False
         self.__last_tablet_input_time = time.time()
@@ -35,12 +67,26 @@ class InputListener(QObject):
             Qt.Key.Key_Alt: False
         }
 
+        self.__published_events = {
+            QEvent.Type.TabletMove, QEvent.Type.MouseMove,
+            QEvent.Type.TabletPress, QEvent.Type.MouseButtonPress,
+            QEvent.Type.TabletRelease, QEvent.Type.MouseButtonRelease,
+            QEvent.Type.Enter, QEvent.Type.Leave
+        }
+
         #brute force canvas input detection
         self.__cancel_input = False
         self.__last_input_sum = 0.0
         self.__time_for_cancel = (1.0 / 48.0) + 0.1
         self.__last_cancel_time = time.time()
-        
+
+        # monotonic time minus the time of the events, the lowest one seen is the one with no dispatch delay
+        self.__event_clock_shift = None
+        self.__last_timestamp = 0.0
+        self.__snapshot = self.__makeSnapshot()
+        # ring of the last published snapshots, written only by the event filter
+        self.__history = [self.__snapshot] * INPUT_HISTORY_SIZE
+        self.__history_count = 0
         
 
 
@@ -69,28 +115,59 @@ class InputListener(QObject):
         return self.__pressure * self.__is_pressing
     
     @property
-    def cursor_movement(self) -> float:
+    def snapshot(self) -> InputSnapshot:
+        """
+        latest state published by the event filter, safe to read from any thread
+        """
+        return self.__snapshot
+
+    @property
+    def history_count(self) -> int:
+        """
+        number of snapshots published since the listener was created
         """
-        read only once per audio callback or it will break
+        return self.__history_count
+
+    def historySince(self, count: int, end: int) -> List[InputSnapshot]:
+        """
+        snapshots published after the first count ones and up to the first end ones,
+        end is a history_count read before so events published meanwhile are left for the next call.
+        Only the last INPUT_HISTORY_SIZE are kept
         """
-        movement = self.__last_cursor_position_read - self.__cursor_potition
-        self.__last_cursor_position_read = self.__cursor_potition
-        return movement
+        start = max(count, end - INPUT_HISTORY_SIZE)
+        return [self.__history[i % INPUT_HISTORY_SIZE] for i in range(start, end)]
 
     @property
     def is_over_canvas(self) -> bool:
         return self.__is_over_canvas
 
+    @property
+    def is_paused(self) -> bool:
+        return self.__is_paused
+
     def startListening(self):
+        self.__is_paused = False
         if not self.__is_listening:
             self.__is_listening = True
             QApplication.instance().installEventFilter(self)
     
     def stopListening(self):
+        self.__is_paused = False
         if self.__is_listening:
             self.__is_listening = False
             QApplication.instance().removeEventFilter(self)
 
+    def pauseListening(self):
+        """
+        the event filter stays installed but ignores the input until startListening,
+        the stroke in progress is released so nothing keeps playing
+        """
+        if self.__is_listening and not self.__is_paused:
+            self.__is_paused = True
+            self.__is_pressing = False
+            self.__pressure = 0.0
+            self.__publish(self.__makeSnapshot())
+
     def setConstrainToCanvas(self, is_using):
         self.__constrain_to_canvas = is_using
 
@@ -119,6 +196,47 @@ class InputListener(QObject):
         else:
             self.__cancel_input = False
 
+    def __eventTime(self, event) -> float:
+        """
+        time the event happened on the monotonic clock, events queued while Krita was busy keep their own time
+        """
+        now = time.monotonic()
+        # enter and leave events have no timestamp, synthesized ones have 0
+        event_ms = event.timestamp() if hasattr(event, "timestamp") else 0
+        if not event_ms:
+            return now
+        shift = now - (event_ms / 1000)
+        if self.__event_clock_shift is None or shift < self.__event_clock_shift or \
+            shift - self.__event_clock_shift > EVENT_CLOCK_RESET_SECONDS:
+            self.__event_clock_shift = shift
+        return (event_ms / 1000) + self.__event_clock_shift
+
+    def __makeSnapshot(self, timestamp: float = None) -> InputSnapshot:
+        if timestamp is None:
+            timestamp = time.monotonic()
+        # readers interpolate between snapshots, their times never go back
+        self.__last_timestamp = max(timestamp, self.__last_timestamp)
+        return InputSnapshot(
+            self.__hover_position.x(), self.__hover_position.y(),
+            self.pressure, self.__is_pressing, self.__is_over_canvas, self.__last_timestamp,
+            self.__stroke_distance.x(), self.__stroke_distance.y(),
+            self.__hover_distance.x(), self.__hover_distance.y()
+        )
+
+    def __publish(self, snapshot: InputSnapshot):
+        # the slot is written before the count so readers never see a slot that isn't there yet
+        self.__history[self.__history_count % INPUT_HISTORY_SIZE] = snapshot
+        self.__history_count += 1
+        self.__snapshot = snapshot
+        self.inputPublished.emit()
+
+    def __moveCursor(self, position: QPoint, is_stroke: bool):
+        if is_stroke:
+            self.__stroke_distance += position - self.__cursor_potition
+            self.__cursor_potition = position
+        self.__hover_distance += position - self.__hover_position
+        self.__hover_position = position
+
     def eventFilter(self, obj, event):
         if obj.__class__ == QWindow:
             #Modifier detection
@@ -128,6 +246,9 @@ class InputListener(QObject):
             if event.type() == QEvent.Type.KeyRelease:
                 if not event.isAutoRepeat() and event.key() in [key for key in self.__modifiers]:
                     self.__modifiers[event.key()] = False
+
+        if self.__is_paused:
+            return super().eventFilter(obj, event)
         
         if obj.__class__ != Qt_QOpenGLWidget and self.__constrain_to_canvas:
             return super().eventFilter(obj, event)
@@ -148,11 +269,17 @@ class InputListener(QObject):
 
         #self.canvasInputDetectionBruteForce(event)
 
+        #hovering
+        if not self.__is_pressing and \
+            (event.type() == QEvent.Type.TabletMove or \
+            event.type() == QEvent.Type.MouseMove):
+            self.__moveCursor(getEventPosition(event), False)
+
         if (self.__is_pressing):
             #position
             if (event.type() == QEvent.Type.TabletMove or \
                 event.type() == QEvent.Type.MouseMove):
-                self.__cursor_potition = getEventPosition(event)
+                self.__moveCursor(getEventPosition(event), True)
                     
             #pressure
             if (event.type() == QEvent.Type.TabletMove):
@@ -172,8 +299,9 @@ class InputListener(QObject):
             not self.is_pressing_modifier:
             self.canvasClicked.emit()
             self.__is_pressing = True
+            # a stroke starts where the cursor is, without moving from the end of the last one
             self.__cursor_potition = getEventPosition(event)
-            self.__last_cursor_position_read = getEventPosition(event)
+            self.__moveCursor(getEventPosition(event), False)
             if event.type() == QEvent.Type.MouseButtonPress:
                 self.__pressure = 1.0
 
@@ -184,10 +312,149 @@ class InputListener(QObject):
             self.__pressure = 0.0
             self.__is_pressing = False
 
+        if event.type() in self.__published_events:
+            self.__publish(self.__makeSnapshot(self.__eventTime(event)))
+
         return super().eventFilter(obj, event)
 
 input_listener = InputListener()
 
+class InputCurves:
+    """
+    Input of a block resampled to one value per sample: pressure (0 to 1) and stroke speed in pixels per second
+    """
+    def __init__(self, frames: int):
+        self.__pressure = np.zeros(frames, dtype=np.float32)
+        self.__speed = np.zeros(frames, dtype=np.float32)
+        self.pressure = self.__pressure
+        self.speed = self.__speed
+
+    @property
+    def frames(self) -> int:
+        return self.pressure.size
+
+    def resize(self, frames: int):
+        """
+        the buffers only grow, smaller blocks use the start of them
+        """
+        if self.__pressure.size < frames:
+            self.__pressure = np.zeros(frames, dtype=np.float32)
+            self.__speed = np.zeros(frames, dtype=np.float32)
+        self.pressure = self.__pressure[:frames]
+        self.speed = self.__speed[:frames]
+
+class InputSnapshotReader:
+    """
+    Reading side of the snapshots of an InputListener, only used by the audio thread.
+    The listener replaces its snapshot instead of modifying it, so taking the latest one needs no lock.
+    read() takes it once per block along with the movement since the last read,
+    readCurves() turns the snapshots published in the meantime into per sample curves
+    """
+    # the stroke is taken as stopped when no movement is published for this long
+    STOP_SECONDS = 0.02
+
+    def __init__(self, listener: InputListener):
+        self.__listener = listener
+        self.__snapshot = listener.snapshot
+        self.movement = QPoint(0, 0)
+        self.hover_movement = QPoint(0, 0)
+
+        self.__history_count = listener.history_count
+        self.__events = [listener.snapshot]
+        self.__clock_shift = None
+        self.__curves = InputCurves(0)
+        self.__sample_times = np.zeros(0)
+        self.__samplerate = 0
+
+    @property
+    def snapshot(self) -> InputSnapshot:
+        """
+        the snapshot taken by the last read
+        """
+        return self.__snapshot
+
+    def read(self) -> InputSnapshot:
+        """
+        movement and hover_movement are updated in place and go from the current snapshot to the previous one
+        """
+        previous = self.__snapshot
+        snapshot = self.__listener.snapshot
+        self.movement.setX(previous.stroke_distance_x - snapshot.stroke_distance_x)
+        self.movement.setY(previous.stroke_distance_y - snapshot.stroke_distance_y)
+        self.hover_movement.setX(previous.hover_distance_x - snapshot.hover_distance_x)
+        self.hover_movement.setY(previous.hover_distance_y - snapshot.hover_distance_y)
+        self.__snapshot = snapshot
+        return snapshot
+
+    def __blockStartTime(self, cffi_time, block_seconds: float) -> float:
+        """
+        Time of the input rendered at the first sample of the block. Blocks are rendered block_seconds behind
+        the input so every sample of the block already has input around it.
+        The shift from the time of the DAC is smoothed, consecutive blocks follow each other like they do at the DAC
+        """
+        now = time.monotonic()
+        dac_time = cffi_time.outputBufferDacTime
+        if dac_time <= 0:
+            # some host apis don't report it
+            return now - block_seconds
+
+        measured_shift = now - dac_time - block_seconds
+        if self.__clock_shift is None or abs(measured_shift - self.__clock_shift) > 0.1:
+            self.__clock_shift = measured_shift
+        else:
+            self.__clock_shift += (measured_shift - self.__clock_shift) * 0.05
+        return dac_time + self.__clock_shift
+
+    def __pressurePoints(self, start_time: float, count: int):
+        for i in range(count):
+            yield (self.__events[i].timestamp - start_time, self.__events[i].pressure)
+
+    def __speedPoints(self, start_time: float, count: int):
+        """
+        speeds of the segments between events sit in the middle of them, and drop to 0 after the last one
+        """
+        for i in range(1, count):
+            previous, event = self.__events[i - 1], self.__events[i]
+            duration = max(event.timestamp - previous.timestamp, 0.001)
+            distance = math.hypot(event.stroke_distance_x - previous.stroke_distance_x,
+                                  event.stroke_distance_y - previous.stroke_distance_y)
+            yield (previous.timestamp + (duration / 2) - start_time, distance / duration)
+        yield (self.__events[count - 1].timestamp + self.STOP_SECONDS - start_time, 0.0)
+
+    def readCurves(self, cffi_time, samplerate: int, frames: int) -> InputCurves:
+        """
+        pressure and speed of the stroke for each sample of the next block, interpolated between the timestamps
+        of the snapshots. The returned curves are reused by the next call
+        """
+        curves = self.__curves
+        curves.resize(frames)
+        if self.__sample_times.size < frames or self.__samplerate != samplerate:
+            self.__sample_times = np.arange(max(frames, self.__sample_times.size)) / samplerate
+            self.__samplerate = samplerate
+
+        start_time = self.__blockStartTime(cffi_time, frames / samplerate)
+        end_time = start_time + (frames / samplerate)
+
+        history_count = self.__listener.history_count
+        if history_count != self.__history_count:
+            self.__events += self.__listener.historySince(self.__history_count, history_count)
+        self.__history_count = history_count
+        # one event before the block is kept to interpolate from
+        first = 0
+        while first + 1 < len(self.__events) and self.__events[first + 1].timestamp <= start_time:
+            first += 1
+        del self.__events[:first]
+        last = 1
+        while last < len(self.__events) and self.__events[last].timestamp <= end_time:
+            last += 1
+
+        sample_times = self.__sample_times[:frames]
+        fill_piecewise_linear(curves.pressure, sample_times, samplerate, self.__pressurePoints(start_time, last))
+        fill_piecewise_linear(curves.speed, sample_times, samplerate, self.__speedPoints(start_time, last))
+        return curves
+
+input_reader = InputSnapshotReader(input_listener)
+
 class BrushPresetListener(QObject):
     currentPresetChanged = Signal(Resource)
     eraserModeChanged = Signal(bool)
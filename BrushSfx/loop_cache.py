@@ -0,0 +1,64 @@
+import os
+import shutil
+import hashlib
+
+import numpy as np
+
+from .Qt.QtCore import QStandardPaths
+
+from .constants import plugin_version
+
+LOOP_CACHE_VERSION = 3
+
+class LoopCache:
+    """
+    Keeps generated sound loops on disk as .npy files so they don't have to be generated on every start.
+    Entries are keyed by the id of what generated them and a recipe tuple, any change to the recipe
+    (filters, samplerate, source file...) makes a new entry and removes the old one.
+    Everything is stored under a directory per plugin version
+    """
+    def __init__(self):
+        self.root_path = os.path.join(QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppDataLocation), 'brushsfx_cache')
+        self.directory = os.path.join(self.root_path, f"{plugin_version}-{LOOP_CACHE_VERSION}")
+        self.__remove_old_versions()
+
+    def __remove_old_versions(self):
+        if not os.path.isdir(self.root_path):
+            return
+        for entry in os.listdir(self.root_path):
+            entry_path = os.path.join(self.root_path, entry)
+            if entry_path != self.directory and os.path.isdir(entry_path):
+                shutil.rmtree(entry_path, ignore_errors=True)
+
+    def get(self, loop_id: str, recipe: tuple, generate) -> np.ndarray:
+        """
+        returns the cached loop memory mapped as read only, or the result of generate() when it isn't cached yet
+        """
+        digest = hashlib.sha1(repr(recipe).encode()).hexdigest()[:16]
+        path = os.path.join(self.directory, f"{loop_id}-{digest}.npy")
+
+        if os.path.isfile(path):
+            try:
+                return np.load(path, mmap_mode='r')
+            except (OSError, ValueError):
+                print(f"[BrushSfx] Discarding broken cache entry {path}")
+
+        samples = generate()
+        self.__store(loop_id, path, samples)
+        return samples
+
+    def __store(self, loop_id: str, path: str, samples: np.ndarray):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for entry in os.listdir(self.directory):
+                if entry.rsplit("-", 1)[0] == loop_id:
+                    os.remove(os.path.join(self.directory, entry))
+
+            temporary_path = path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                np.save(file, samples)
+            os.replace(temporary_path, path)
+        except OSError as error:
+            print(f"[BrushSfx] Could not cache {loop_id}: {error}")
+
+loop_cache = LoopCache()
@@ -0,0 +1,73 @@
+from fractions import Fraction
+import math
+
+import numpy as np
+
+# zero crossings of the sinc on each side of a sample, more is sharper and slower
+RESAMPLE_ZERO_CROSSINGS = 16
+RESAMPLE_KAISER_BETA = 8.0
+# the filter bank has one phase per output sample position between two input samples,
+# ratios needing more phases than this are rounded to the closest one that doesn't
+RESAMPLE_MAX_PHASES = 1024
+# outputs computed at once, bounds the memory used by the gathered taps
+RESAMPLE_CHUNK = 8192
+
+def resample_ratio(source_samplerate: int, target_samplerate: int) -> Fraction:
+    """
+    up/down factors used to go from source_samplerate to target_samplerate
+    """
+    return Fraction(int(target_samplerate), int(source_samplerate)).limit_denominator(RESAMPLE_MAX_PHASES)
+
+def polyphase_bank(up: int, down: int, zero_crossings: int = RESAMPLE_ZERO_CROSSINGS) -> np.ndarray:
+    """
+    Kaiser windowed sinc low pass split in up phases of 2*zero_crossings taps each (on the input grid).
+    The cutoff is the lower of the two nyquist frequencies, slightly lowered so the transition band stays under it
+    """
+    cutoff = min(1.0, up / down) * 0.95
+    # the sinc is stretched when downsampling, so it keeps the same number of zero crossings at the lower rate
+    half_width = int(math.ceil(zero_crossings / cutoff))
+    offsets = np.arange(-half_width + 1, half_width + 1)
+    phases = np.arange(up) / up
+    # distance from the output position (input index + phase) to each tap
+    distance = offsets[None, :] - phases[:, None]
+    window = np.i0(RESAMPLE_KAISER_BETA * np.sqrt(np.clip(1.0 - (distance / half_width) ** 2, 0.0, 1.0)))
+    window /= np.i0(RESAMPLE_KAISER_BETA)
+    bank = cutoff * np.sinc(cutoff * distance) * window
+    # every phase keeps a gain of one, so a constant signal stays constant
+    bank /= bank.sum(axis=1, keepdims=True)
+    return bank.astype(np.float32)
+
+def resample(samples: np.ndarray, source_samplerate: int, target_samplerate: int, loop: bool = False) -> np.ndarray:
+    """
+    Resamples samples to target_samplerate with a polyphase windowed sinc filter.
+    A loop is resampled as if it repeated forever, so its seam stays seamless,
+    otherwise the signal is taken as silent before and after the samples
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    ratio = resample_ratio(source_samplerate, target_samplerate)
+    if ratio == 1 or samples.size == 0:
+        return samples.copy()
+    up, down = ratio.numerator, ratio.denominator
+
+    bank = polyphase_bank(up, down)
+    half_width = bank.shape[1] // 2
+    if loop:
+        repeats = -(-half_width // samples.size)
+        tiled = np.tile(samples, 2 * repeats + 1)
+        padded = tiled[(repeats * samples.size) - half_width:((repeats + 1) * samples.size) + half_width]
+    else:
+        padded = np.concatenate([np.zeros(half_width, dtype=np.float32), samples, np.zeros(half_width, dtype=np.float32)])
+
+    out_size = int(round(samples.size * up / down))
+    out = np.empty(out_size, dtype=np.float32)
+    taps = np.arange(bank.shape[1])
+    for start in range(0, out_size, RESAMPLE_CHUNK):
+        positions = np.arange(start, min(start + RESAMPLE_CHUNK, out_size)) * down
+        # input sample at or before each output, and which phase of the bank sits between it and the next
+        indices = positions // up
+        phases = positions % up
+        if loop:
+            indices %= samples.size
+        gathered = padded[indices[:, None] + taps[None, :] + 1]
+        np.einsum("ij,ij->i", gathered, bank[phases], out=out[start:start + positions.size])
+    return out
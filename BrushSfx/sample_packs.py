@@ -0,0 +1,191 @@
+import os
+import json
+import math
+import hashlib
+from typing import List
+
+from .Qt.QtCore import QStandardPaths
+
+from .filter import LowPassFilter, HighPassFilter, PeakFilter
+from .wav_reader import WavReader
+
+SAMPLE_PACK_MANIFEST = "manifest.json"
+SAMPLE_PACK_INDEX_VERSION = 1
+
+class SamplePack:
+    """
+    A sound made of the WAV files of a directory, described by its manifest.json:
+    {
+        "name": "chalk",                          shown in the sound list, the directory name by default
+        "samples": ["a.wav", "b.wav"],            played one after the other in a loop, every WAV by default
+        "gain": 1.0,
+        "max_speed": 6,                           in screens per second, the speed at the end of the curve
+        "speed_curve": [[0, 0], [0.3, 0.8], [1, 1]],   gain for the speed from 0 to 1, interpolated
+        "pressure_gain": [0.3, 1.0],              gain at no pressure and at full pressure
+        "filters": [["peak", 200, 400, 1000, 1700, 2.5], ["lowpass", 8000, 12000], ["highpass", 120, 60]]
+    }
+    filters are applied once when the samples are loaded. A manifest with invalid values raises an exception
+    """
+    def __init__(self, pack_id: str, directory: str, manifest: dict, samples: List[str], signature: tuple):
+        self.id = pack_id
+        self.directory = directory
+        self.name = str(manifest.get("name", os.path.basename(directory)))
+        self.samples = samples
+        self.gain = manifest_number(manifest.get("gain", 1.0), "gain")
+        self.max_speed = manifest_number(manifest.get("max_speed", 6), "max_speed")
+        if self.max_speed <= 0:
+            raise Exception("max_speed should be above 0")
+        # the curve is read with np.interp while playing, so it has to have a point
+        speed_curve = manifest.get("speed_curve", [[0, 0], [1, 1]])
+        if not isinstance(speed_curve, list) or not speed_curve:
+            raise Exception("speed_curve should have at least one [speed, gain] point")
+        self.speed_curve = sorted(manifest_numbers(point, 2, "speed_curve point") for point in speed_curve)
+        self.pressure_gain = manifest_numbers(manifest.get("pressure_gain", [0.3, 1.0]), 2, "pressure_gain")
+        self.filters = [build_pack_filter(description) for description in manifest.get("filters", [])]
+        # changes whenever the manifest or one of the samples changes
+        self.signature = signature
+
+    def __repr__(self):
+        return f"SamplePack({self.id}, {self.name}, {len(self.samples)} samples)"
+
+def manifest_number(value, name: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise Exception(f"{name} should be a number")
+    return float(value)
+
+def manifest_numbers(values, count: int, name: str) -> tuple:
+    if not isinstance(values, list) or len(values) != count:
+        raise Exception(f"{name} should be a list of {count} numbers")
+    return tuple(manifest_number(value, name) for value in values)
+
+def build_pack_filter(description: list):
+    if not isinstance(description, list) or not description:
+        raise Exception("a filter should be a list starting with its type")
+    kind = description[0]
+    if kind == "peak":
+        if len(description) == 5:
+            # the gain can be left out, like in PeakFilter
+            description = description + [0.0]
+        return PeakFilter(*manifest_numbers(description[1:], 5, "peak filter"))
+    if kind == "lowpass":
+        pass_freq, cutoff = manifest_numbers(description[1:], 2, "lowpass filter")
+        # the response is divided by the distance between the two
+        if cutoff <= pass_freq:
+            raise Exception("the cutoff of a lowpass filter should be above its pass frequency")
+        return LowPassFilter(pass_freq, cutoff)
+    if kind == "highpass":
+        pass_freq, cutoff = manifest_numbers(description[1:], 2, "highpass filter")
+        if cutoff >= pass_freq:
+            raise Exception("the cutoff of a highpass filter should be below its pass frequency")
+        return HighPassFilter(pass_freq, cutoff)
+    raise Exception(f"Unknown filter {kind}")
+
+class SamplePackScanner:
+    """
+    Finds the sample packs in the user sound directory, every sub directory with a manifest.json is a pack.
+    What was read from each file is kept in an index along with its size and modification time,
+    so a scan only opens the manifests and WAV files that changed since the last one
+    """
+    def __init__(self):
+        app_data = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppDataLocation)
+        self.directory = os.path.join(app_data, 'brushsfx_sounds')
+        self.index_path = os.path.join(app_data, 'brushsfx_cache', 'sample_packs.json')
+        self.__index = None
+
+    def __load_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as file:
+                index = json.load(file)
+            if index.get("version") == SAMPLE_PACK_INDEX_VERSION:
+                return index["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def __save_index(self, files: dict):
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            temporary_path = self.index_path + ".tmp"
+            with open(temporary_path, "w") as file:
+                json.dump({"version": SAMPLE_PACK_INDEX_VERSION, "files": files}, file)
+            os.replace(temporary_path, self.index_path)
+        except OSError as error:
+            print(f"[BrushSfx] Could not save the sample pack index: {error}")
+
+    def __read(self, path: str, stats: os.stat_result, read_file):
+        """
+        what read_file(path) returned the last time the file had the same size and modification time
+        """
+        entry = self.__index.get(path)
+        if entry is not None and entry["size"] == stats.st_size and entry["mtime"] == stats.st_mtime_ns:
+            self.__scanned[path] = entry
+            return entry["content"]
+        content = read_file(path)
+        self.__scanned[path] = {"size": stats.st_size, "mtime": stats.st_mtime_ns, "content": content}
+        return content
+
+    def scan(self) -> List[SamplePack]:
+        os.makedirs(self.directory, exist_ok=True)
+        if self.__index is None:
+            self.__index = self.__load_index()
+        self.__scanned = {}
+
+        packs = []
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.name):
+            if not entry.is_dir():
+                continue
+            try:
+                pack = self.__scan_pack(entry.path)
+            except Exception as error:
+                print(f"[BrushSfx] Skipping sample pack {entry.name}: {error}")
+                continue
+            if pack is not None:
+                packs.append(pack)
+
+        if self.__scanned != self.__index:
+            self.__save_index(self.__scanned)
+        self.__index = self.__scanned
+        print(f"[BrushSfx] Found {len(packs)} sample packs in {self.directory}")
+        return packs
+
+    def __scan_pack(self, directory: str) -> SamplePack:
+        manifest_path = os.path.join(directory, SAMPLE_PACK_MANIFEST)
+        if not os.path.isfile(manifest_path):
+            return None
+        manifest_stats = os.stat(manifest_path)
+        manifest = self.__read(manifest_path, manifest_stats, read_manifest)
+
+        sample_names = manifest.get("samples")
+        if sample_names is None:
+            sample_names = sorted(name for name in os.listdir(directory) if name.lower().endswith(".wav"))
+
+        samples = []
+        signature = [(SAMPLE_PACK_MANIFEST, manifest_stats.st_size, manifest_stats.st_mtime_ns)]
+        for name in sample_names:
+            path = os.path.join(directory, name)
+            stats = os.stat(path)
+            header = self.__read(path, stats, read_wav_header)
+            if header["frames"] == 0:
+                continue
+            samples.append(path)
+            signature.append((name, stats.st_size, stats.st_mtime_ns))
+        if not samples:
+            raise Exception("no samples")
+
+        pack_id = hashlib.sha1(os.path.basename(directory).encode()).hexdigest()[:12]
+        return SamplePack(pack_id, directory, manifest, samples, tuple(signature))
+
+def read_manifest(path: str) -> dict:
+    with open(path, "r") as file:
+        manifest = json.load(file)
+    if not isinstance(manifest, dict):
+        raise Exception(f"{SAMPLE_PACK_MANIFEST} should be an object")
+    return manifest
+
+def read_wav_header(path: str) -> dict:
+    reader = WavReader(path)
+    header = {"samplerate": reader.samplerate, "channels": reader.channels, "frames": reader.frames}
+    reader.close()
+    return header
+
+sample_pack_scanner = SamplePackScanner()
@@ -1,32 +1,263 @@
 
-from .Qt.QtCore import QObject
+from .Qt.QtCore import QObject, QPoint
 
 import wave
 import random
 import math
+import threading
+import queue
 
 import numpy as np
 import sounddevice as sd
 
-from .utils import clamp, lerp
-from .constants import BLOCKSIZE
+from .utils import clamp, lerp, UnitRamp
+from .constants import DEFAULT_SAMPLERATE, DEFAULT_BLOCKSIZE, VARIABLE_BLOCKSIZE_HOP, DEFAULT_LATENCY, DEFAULT_MAX_VOICES, \
+DEFAULT_IDLE_SUSPEND_SECONDS, DEFAULT_CROSSFADE_SECONDS
 from .filter import apply_filter, PeakFilter
-from .input import InputListener, input_listener, brush_preset_listener
-from .sound_source import PencilSFXSource, EraserSfx
+from .input import InputSnapshotReader, InputCurves, input_listener, input_reader, brush_preset_listener
+from .sound_source import SFXSource, SilenceSfx
 from .EKritaTools import EKritaTools, EKritaToolsId
 
+ROLE_BRUSH = "brush"
+ROLE_ERASER = "eraser"
+
+SILENCE_THRESHOLD = 1e-5
+MAX_RELEASE_SECONDS = 1.0
+
+class Voice:
+    """
+    A source playing on the mixer for some roles, it only gets the input while one of its roles is in use.
+    Once it has no roles left it is released and fades out, fade is its gain going towards fade_target.
+    A released voice keeps getting the input of the role it was released from until it has faded out
+    """
+    def __init__(self, source: SFXSource, role: str, fade: float = 1.0):
+        self.source = source
+        self.roles = {role}
+        self.idle = False
+        self.released_seconds = None
+        self.released_role = None
+        self.fade = fade
+        self.fade_target = 1.0
+
+    @property
+    def is_released(self) -> bool:
+        return self.released_seconds is not None
+
+class MixerBus:
+    """
+    Plays the sources of the player at the same time so they can overlap and fade out on their own.
+    Voices that are silent and get no input are skipped, the rest render into a row of one buffer each
+    and the rows are summed into the output.
+    Sources are set from the GUI thread and picked up by the audio thread at the start of a block,
+    a source replacing another one crossfades with it. The audio thread never frees a source,
+    the voices it drops are kept until the next setSource
+    """
+    def __init__(self, max_voices: int = DEFAULT_MAX_VOICES, blocksize: int = DEFAULT_BLOCKSIZE):
+        self.__max_voices = max(2, max_voices)
+        self.__blocksize = blocksize
+        self.__requested_sources = {}
+        # sources are set from more than one thread, each copy has to start from the last one
+        self.__requested_sources_lock = threading.Lock()
+        self.__applied_sources = None
+        self.__voices = []
+        self.__buffer = np.zeros((self.__max_voices, max(self.__blocksize, VARIABLE_BLOCKSIZE_HOP)), dtype=np.float32)
+        self.__rest_movement = QPoint(0, 0)
+        self.__crossfade_seconds = DEFAULT_CROSSFADE_SECONDS
+        self.__unit_ramp = UnitRamp()
+        self.__fade = np.zeros(self.__buffer.shape[1], dtype=np.float32)
+        # voices dropped by the audio thread, emptied on the GUI side so their sources are freed there
+        self.__retired_voices = queue.SimpleQueue()
+
+    def maxVoices(self) -> int:
+        return self.__max_voices
+
+    def setMaxVoices(self, max_voices: int):
+        self.__max_voices = max(2, max_voices)
+
+    def crossfadeSeconds(self) -> float:
+        return self.__crossfade_seconds
+
+    def setCrossfadeSeconds(self, seconds: float):
+        """
+        length of the crossfade between a source and the one replacing it, at least one block
+        """
+        self.__crossfade_seconds = max(0.0, seconds)
+
+    def blocksize(self) -> int:
+        return self.__blocksize
+
+    def setBlocksize(self, blocksize: int):
+        """
+        resizes the buffers and the sources of every voice, the stream must be stopped while this runs
+        """
+        self.__blocksize = blocksize
+        self.__buffer = np.zeros((self.__max_voices, max(self.__blocksize, VARIABLE_BLOCKSIZE_HOP)), dtype=np.float32)
+        self.__fade = np.zeros(self.__buffer.shape[1], dtype=np.float32)
+        sources = [voice.source for voice in self.__voices] + list(self.__requested_sources.values())
+        for source in sources:
+            if source.get_blocksize() != blocksize:
+                source.set_blocksize(blocksize)
+
+    def source(self, role: str) -> SFXSource:
+        return self.__requested_sources.get(role)
+
+    def setSource(self, role: str, source: SFXSource):
+        # the dictionary is replaced, not modified, so the audio thread never sees it change under it
+        with self.__requested_sources_lock:
+            requested_sources = dict(self.__requested_sources)
+            requested_sources[role] = source
+            self.__requested_sources = requested_sources
+        self.releaseRetiredSources()
+
+    def releaseRetiredSources(self):
+        """
+        lets go of the voices dropped by the audio thread, their sources get freed on the calling thread
+        """
+        while True:
+            try:
+                self.__retired_voices.get_nowait()
+            except queue.Empty:
+                return
+
+    def __applyRequestedSources(self):
+        requested_sources = self.__requested_sources
+        if requested_sources is self.__applied_sources:
+            return
+        self.__applied_sources = requested_sources
+
+        for role, source in requested_sources.items():
+            current = next((voice for voice in self.__voices if role in voice.roles), None)
+            if current is not None and current.source is source:
+                continue
+            if current is not None:
+                current.roles.discard(role)
+                if not current.roles:
+                    current.released_seconds = 0.0
+                    current.released_role = role
+                    current.fade_target = 0.0
+            # a source is only played by one voice, even a released one comes back for its new role
+            shared = next((voice for voice in self.__voices if voice.source is source), None)
+            if shared is not None:
+                shared.roles.add(role)
+                shared.released_seconds = None
+                shared.released_role = None
+                shared.fade_target = 1.0
+                continue
+            # a source replacing another one fades in while the other one fades out
+            self.__voices.append(Voice(source, role, 0.0 if current is not None else 1.0))
+
+        while len(self.__voices) > self.__max_voices:
+            released = [voice for voice in self.__voices if voice.is_released]
+            # the voice cap drops the oldest release first
+            dropped = released[0] if released else self.__voices[0]
+            self.__voices.remove(dropped)
+            self.__retired_voices.put(dropped)
+
+    def __applyFade(self, voice: Voice, samples: np.ndarray):
+        if voice.fade == voice.fade_target:
+            if voice.fade != 1.0:
+                samples *= voice.fade
+            return
+        frames = samples.size
+        step = frames / max(self.__crossfade_seconds * voice.source.get_samplerate(), frames)
+        if voice.fade < voice.fade_target:
+            end = min(voice.fade + step, voice.fade_target)
+        else:
+            end = max(voice.fade - step, voice.fade_target)
+        fade = self.__fade[:frames]
+        np.multiply(self.__unit_ramp.get(frames), end - voice.fade, out=fade)
+        fade += voice.fade
+        samples *= fade
+        voice.fade = end
+
+    def isIdle(self) -> bool:
+        """
+        true when every voice went silent on its own and there is no new source to pick up,
+        without input the next block would be silent too
+        """
+        if self.__requested_sources is not self.__applied_sources:
+            return False
+        for voice in self.__voices:
+            if not (voice.idle and voice.source.can_idle()):
+                return False
+        return True
+
+    def __isFinished(self, voice: Voice) -> bool:
+        return voice.is_released and (voice.idle or voice.fade == 0.0 or voice.released_seconds > MAX_RELEASE_SECONDS)
+
+    def render(self, out: np.ndarray, cffi_time, cursor_movement: QPoint, pressure: float, role: str,
+               curves: InputCurves = None) -> np.ndarray:
+        """
+        mixes the next out.size frames of every voice into out, only the voices playing role
+        or fading out of it get the input
+        """
+        self.__applyRequestedSources()
+        frames = out.size
+        # the buffer only grows, blocks of any size render into the start of its rows
+        if self.__buffer.shape[0] != self.__max_voices or self.__buffer.shape[1] < frames:
+            self.__buffer = np.zeros((self.__max_voices, max(frames, self.__buffer.shape[1])), dtype=np.float32)
+            self.__fade = np.zeros(self.__buffer.shape[1], dtype=np.float32)
+
+        has_input = pressure > 0 or cursor_movement.x() != 0 or cursor_movement.y() != 0
+        rendered = 0
+        finished_voices = False
+        for voice in self.__voices:
+            # a voice fading out keeps following the stroke, __applyFade takes it down
+            is_playing = role in voice.roles or (voice.is_released and voice.released_role == role)
+            at_rest = not (is_playing and has_input)
+            if voice.idle and at_rest and voice.source.can_idle():
+                continue
+
+            samples = self.__buffer[rendered, :frames]
+            if is_playing:
+                voice.source.get_samples(cffi_time, cursor_movement, pressure, samples, curves)
+            else:
+                self.__rest_movement.setX(0)
+                self.__rest_movement.setY(0)
+                voice.source.get_samples(cffi_time, self.__rest_movement, 0.0, samples)
+            self.__applyFade(voice, samples)
+            rendered += 1
+
+            voice.idle = at_rest and samples.max() < SILENCE_THRESHOLD and samples.min() > -SILENCE_THRESHOLD
+            if voice.is_released:
+                voice.released_seconds += frames / voice.source.get_samplerate()
+                finished_voices = finished_voices or self.__isFinished(voice)
+
+        if finished_voices:
+            for voice in self.__voices:
+                if self.__isFinished(voice):
+                    self.__retired_voices.put(voice)
+            self.__voices = [voice for voice in self.__voices if not self.__isFinished(voice)]
+
+        np.sum(self.__buffer[:rendered, :frames], axis=0, out=out)
+        return out
+
 class SoundPlayer(QObject):
-    def __init__(self, input_data: InputListener):
+    def __init__(self, input_data: InputSnapshotReader):
         super().__init__()
         self.__volume = 0.0
-        self.__brush_sfx_source = PencilSFXSource()
+        # the stream never changes rate, sources are built for it
+        self.__samplerate = self.__queryDeviceSamplerate()
+        self.__brush_sfx_source = SilenceSfx(self.__samplerate) # until the extension has built the chosen sources
         self.__use_eraser_sfx = False
-        self.__eraser_sfx_source = EraserSfx()
+        self.__eraser_sfx_source = SilenceSfx(self.__samplerate)
         self.__is_playing = False
         self.__is_using_valid_tool = 1
         self.__using_tool_detection = True
         self.__is_using_eraser = 0
-        self.input_data: InputListener = input_data
+        self.input_data: InputSnapshotReader = input_data
+        self.__blocksize = DEFAULT_BLOCKSIZE
+        self.__latency = DEFAULT_LATENCY
+        self.mixer = MixerBus(blocksize=self.__blocksize)
+        self.mixer.setSource(ROLE_BRUSH, self.__brush_sfx_source)
+        self.mixer.setSource(ROLE_ERASER, self.__eraser_sfx_source)
+        # seconds of silence before the stream stops itself, 0 never stops it
+        self.__idle_suspend_seconds = DEFAULT_IDLE_SUSPEND_SECONDS
+        self.__idle_seconds = 0.0
+        self.__is_suspended = False
+        # the stream stays open but silent and ignores the input
+        self.__is_standby = False
+        self.__no_movement = QPoint(0, 0)
         
         
 
@@ -46,59 +277,153 @@ class SoundPlayer(QObject):
         ]
         EKritaTools.notifier.toolChanged.connect(self.listen_tool_change)
         brush_preset_listener.eraserModeChanged.connect(self.listen_eraser_mode)
+        input_listener.inputPublished.connect(self.__resume)
 
-        self.play_stream = sd.OutputStream(
-            samplerate=self.__brush_sfx_source.get_samplerate(),
-            blocksize=BLOCKSIZE,
-            latency='low',
-            channels=1,
-            callback=self.callback
-        )
+        self.play_stream = self.__createStream()
 
 
     def callback(self, outdata, frames: int, cffi_time, status: sd.CallbackFlags):
 
-        movement = self.input_data.cursor_movement
-        if not self.__is_using_eraser:
-            samples = self.__brush_sfx_source.get_samples(cffi_time, movement, self.input_data.pressure)
-        elif self.__is_using_eraser and self.__use_eraser_sfx:
-            samples = self.__eraser_sfx_source.get_samples(cffi_time, movement, self.input_data.pressure)
+        # the mixer renders straight into the output buffer
+        samples = outdata[:, 0]
+        input_snapshot = self.input_data.read()
+        movement = self.input_data.movement
+        pressure = input_snapshot.pressure
+        is_standby = self.__is_standby
+        if is_standby:
+            # the voices fade out unheard, then the block is skipped like any other silence
+            movement = self.__no_movement
+            pressure = 0.0
+
+        # nothing to play and no input, the sources and the curves are skipped
+        has_input = pressure > 0 or movement.x() != 0 or movement.y() != 0
+        if not has_input and self.mixer.isIdle():
+            samples.fill(0.0)
+            # standby keeps the stream running so turning sound on doesn't have to restart it
+            self.__idle_seconds = 0.0 if is_standby else self.__idle_seconds + (frames / self.__samplerate)
+            if self.__idle_suspend_seconds > 0 and self.__idle_seconds >= self.__idle_suspend_seconds:
+                # the stream stops after this block, the next input starts it again
+                self.__is_suspended = True
+                raise sd.CallbackStop
+            return
+        self.__idle_seconds = 0.0
+
+        curves = self.input_data.readCurves(cffi_time, self.__samplerate, frames) if not is_standby else None
+        if is_standby:
+            role = None
+        elif not self.__is_using_eraser:
+            role = ROLE_BRUSH
+        elif self.__use_eraser_sfx:
+            role = ROLE_ERASER
         else:
-            samples = np.zeros(BLOCKSIZE)
+            role = None
+        self.mixer.render(samples, cffi_time, movement, pressure, role, curves)
 
         exponential_volume = (math.pow(10, 3/10*self.__volume) - 1.0)
         is_valid_tool = self.__is_using_valid_tool if self.__using_tool_detection else 1
-        outdata[:, 0] = samples[:] * exponential_volume * is_valid_tool
+        samples *= exponential_volume * is_valid_tool * (not is_standby)
 
 
     def setSoundSource(self, sound_source):
-        previous_samplerate = self.__brush_sfx_source.get_samplerate()
+        if sound_source.get_blocksize() != self.__blocksize:
+            sound_source.set_blocksize(self.__blocksize)
         self.__brush_sfx_source = sound_source
-        if previous_samplerate != self.__brush_sfx_source.get_samplerate():
-            self.__recreateStream()
+        self.mixer.setSource(ROLE_BRUSH, sound_source)
 
     def enableUseEraser(self, enable):
         self.__use_eraser_sfx = enable
 
     def setEraserSoundSource(self, sound_source):
+        if sound_source.get_blocksize() != self.__blocksize:
+            sound_source.set_blocksize(self.__blocksize)
         self.__eraser_sfx_source = sound_source
+        self.mixer.setSource(ROLE_ERASER, sound_source)
 
     def setUseToolDetection(self, use_detection):
         self.__using_tool_detection = use_detection
 
-    def __recreateStream(self):
-        was_playing = self.__is_playing
-        self.stopPlaying()
-        self.play_stream = sd.OutputStream(
-            samplerate=self.__brush_sfx_source.get_samplerate(),
-            blocksize=BLOCKSIZE,
-            latency='low',
+    def __queryDeviceSamplerate(self) -> int:
+        """
+        native rate of the default output device, so the OS mixer doesn't have to resample the stream
+        """
+        try:
+            device = sd.query_devices(kind='output')
+            samplerate = int(device["default_samplerate"])
+            sd.check_output_settings(samplerate=samplerate, channels=1, dtype='float32')
+        except (sd.PortAudioError, ValueError) as error:
+            print(f"[BrushSfx] Could not use the rate of the output device, playing at {DEFAULT_SAMPLERATE}Hz: {error}")
+            return DEFAULT_SAMPLERATE
+        return samplerate
+
+    def __createStream(self) -> sd.OutputStream:
+        stream = sd.OutputStream(
+            samplerate=self.__samplerate,
+            blocksize=self.__blocksize,
+            latency=self.__latency,
             channels=1,
+            dtype='float32',
             callback=self.callback
         )
+        print(f"[BrushSfx] Opened output stream at {stream.samplerate:g}Hz, "
+              f"{stream.blocksize or 'variable'} frames per block, {stream.latency * 1000:.1f}ms latency")
+        return stream
+
+    def samplerate(self) -> int:
+        """
+        rate sources have to be built for
+        """
+        return self.__samplerate
+
+    def blocksize(self) -> int:
+        return self.__blocksize
+
+    def latency(self) -> str:
+        return self.__latency
+
+    def setStreamSettings(self, blocksize: int, latency: str):
+        """
+        block size in frames and latency profile of the stream, the stream is recreated when they change
+        """
+        if blocksize == self.__blocksize and latency == self.__latency:
+            return
+        was_playing = self.__is_playing
+        self.stopPlaying()
+        self.__blocksize = blocksize
+        self.__latency = latency
+        self.mixer.setBlocksize(blocksize)
+        self.play_stream = self.__createStream()
         if was_playing:
             self.startPlaying()
 
+    def idleSuspendSeconds(self) -> float:
+        return self.__idle_suspend_seconds
+
+    def setIdleSuspendSeconds(self, seconds: float):
+        """
+        the stream stops after being silent for this long while nothing is drawn, 0 keeps it running.
+        It never stops in standby. Any new input, hovering included, starts it again, which takes about
+        the latency of the stream plus the time PortAudio needs to restart it, a few tens of milliseconds
+        """
+        self.__idle_suspend_seconds = max(0.0, seconds)
+
+    def isSuspended(self) -> bool:
+        return self.__is_suspended
+
+    def isStandby(self) -> bool:
+        return self.__is_standby
+
+    def setStandby(self, standby: bool):
+        """
+        keeps the stream open but silent, turning sound on and off this way takes effect on the next block
+        """
+        self.__is_standby = standby
+        if not standby:
+            self.__resume()
+
+    def __resume(self):
+        if self.__is_suspended and self.__is_playing:
+            self.startPlaying()
+
     def listen_tool_change(self, tool_id, is_checked):
         if is_checked:
             self.__is_using_valid_tool = 1 if tool_id in self.allowed_tools else 0
@@ -112,11 +437,20 @@ class SoundPlayer(QObject):
     def setVolume(self, value):
         self.__volume = clamp(value, 0.0, 1.0)
 
+    def isPlaying(self) -> bool:
+        return self.__is_playing
+
     def startPlaying(self):
         self.__is_playing = True
+        if self.__is_suspended:
+            # a stream stopped from its callback has to be stopped again before it can start
+            self.play_stream.stop()
+            self.__is_suspended = False
+        self.__idle_seconds = 0.0
         self.play_stream.start()
     def stopPlaying(self):
         self.__is_playing = False
+        self.__is_suspended = False
         self.play_stream.stop()
 
-sound_player = SoundPlayer(input_listener)
\ No newline at end of file
+sound_player = SoundPlayer(input_reader)
\ No newline at end of file
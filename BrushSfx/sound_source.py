@@ -1,17 +1,32 @@
 
 
 from .Qt.QtCore import QPoint
-from .Qt.QtGui import QGuiApplication, QCursor
+from .Qt.QtGui import QGuiApplication
 
+import os
 import math
-import wave
 
 import numpy as np
 
-from .utils import lerp, clamp, Vector2, smooth_lerp
-from .constants import dir_path, BLOCKSIZE
+from .utils import clamp, Vector2, quantize, lerp_array, smooth_lerp_array, log_curve
+from .constants import dir_path, DEFAULT_SAMPLERATE, DEFAULT_BLOCKSIZE, VARIABLE_BLOCKSIZE_HOP, FILTER_BACKEND_FFT, DEFAULT_WAVETABLE_ANCHORS
 from .filter import apply_filter, PeakFilter
-from .input import input_listener
+from .dsp_graph import DSPGraph, Node, LoopNode, FilterNode, GainNode, MixNode
+from .input import InputCurves, input_reader
+from .loop_cache import loop_cache
+from .resample import resample
+from .wav_reader import WavReader
+
+_primary_screen_height_px = None
+
+def primary_screen_height() -> int:
+    """
+    read once, the first call has to come from the GUI thread
+    """
+    global _primary_screen_height_px
+    if _primary_screen_height_px is None:
+        _primary_screen_height_px = QGuiApplication.instance().primaryScreen().size().height()
+    return _primary_screen_height_px
 
 class WavObject:
     def __init__(self, samplerate: int, samples: np.ndarray):
@@ -20,45 +35,237 @@ class WavObject:
         self.samples = samples
 
 def generate_from_file(path):
-    stream = wave.open(path, "rb")
-
-    samplerate = stream.getframerate()
-    samples = stream.readframes(-1)
-
-    # Convert buffer to float32 using NumPy
-    audio_as_np_int16 = np.frombuffer(samples, dtype=np.int16)
-    audio_as_np_float32 = audio_as_np_int16.astype(np.float32)[0::stream.getnchannels()]
-
-    # Normalize float32 array so that values are between -1.0 and +1.0
-    max_int16 = 2 ** 15
-    audio_normalised = audio_as_np_float32 / max_int16
-
-    audio = WavObject(samplerate, audio_normalised)
-    stream.close()
+    reader = WavReader(path)
+    audio = WavObject(reader.samplerate, reader.read())
+    reader.close()
 
     return audio
 
+def load_from_file(path, samplerate: int = None) -> WavObject:
+    """
+    generate_from_file going through the loop cache, the returned samples are read only.
+    When samplerate is given the samples are resampled to it before being cached
+    """
+    reader = WavReader(path)
+    file_samplerate = reader.samplerate
+    reader.close()
+    if samplerate is None:
+        samplerate = file_samplerate
+
+    file_stats = os.stat(path)
+    recipe = (os.path.basename(path), file_stats.st_size, file_stats.st_mtime_ns, samplerate)
+    samples = loop_cache.get(f"file_{os.path.splitext(os.path.basename(path))[0]}", recipe,
+                             lambda: resample(generate_from_file(path).samples, file_samplerate, samplerate, loop=True))
+    return WavObject(samplerate, samples)
+
+RAMP_LINEAR = "linear"
+RAMP_ONE_POLE = "one_pole"
+
+class ParameterRamp:
+    """
+    Moves a parameter from its last value to a new target sample by sample.
+    A linear ramp reaches the target after time_constant seconds, a one pole ramp gets about 63% of the way there
+    """
+    def __init__(self, time_constant: float, samplerate: int, kind: str = RAMP_ONE_POLE, value: float = 0.0):
+        self.time_constant = time_constant
+        self.samplerate = samplerate
+        self.kind = kind
+        self.value = value
+        self.__shape = np.zeros(0, dtype=np.float32)
+        self.__ramp = np.zeros(0, dtype=np.float32)
+
+    def set_frames(self, frames: int):
+        """
+        prepares the ramp for blocks of up to frames, a larger block prepares it again
+        """
+        # the ramp always goes from 0 to 1 along the same shape, only its start and end change,
+        # and a shorter block uses the start of that shape
+        n = np.arange(1, frames + 1)
+        length = max(self.time_constant * self.samplerate, 1.0)
+        if self.kind == RAMP_LINEAR:
+            shape = np.minimum(n / length, 1.0)
+        else:
+            shape = 1.0 - np.exp(-n / length)
+        self.__shape = shape.astype(np.float32)
+        self.__ramp = np.zeros(frames, dtype=np.float32)
+
+    def process(self, target: float, frames: int) -> np.ndarray:
+        """
+        values of the parameter for each of the next frames, the returned buffer is reused by the next call
+        """
+        if self.__shape.size < frames:
+            self.set_frames(frames)
+        ramp = self.__ramp[:frames]
+        np.multiply(self.__shape[:frames], target - self.value, out=ramp)
+        ramp += self.value
+        self.value = float(ramp[-1])
+        return ramp
+
+    def advance(self, target: float, frames: int) -> float:
+        """
+        same movement as process, for parameters only read once per block
+        """
+        if self.__shape.size < frames:
+            self.set_frames(frames)
+        self.value += (target - self.value) * float(self.__shape[frames - 1])
+        return self.value
+
 class SFXSource:
-    def __init__(self):
-        self._samplerate = 48000
-        
-        self.__zero_to_one = np.linspace(start=0,stop=1, num=BLOCKSIZE)
-        self.__zero_to_one = self.__zero_to_one * self.__zero_to_one * (3.0 -2.0 * self.__zero_to_one)
+    """
+    Sound sources describe their sound as a graph of nodes (see dsp_graph) in _set_graph,
+    and turn the input into the parameters of the graph in get_samples
+    """
+    # parameter name: (time constant in seconds, RAMP_LINEAR or RAMP_ONE_POLE)
+    # the parameters of GainNodes are smoothed per sample, others are used with _smooth and _smooth_value
+    _smoothed_parameters = {}
+    # a stroke that stops for less than this still counts as moving
+    MOVING_HOLD_SECONDS = 0.065
+
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE):
+        self._samplerate = samplerate
+        self._blocksize = DEFAULT_BLOCKSIZE
 
         self.max_speed = 6 # in screens per second
-        self._window_height_px = QGuiApplication.instance().primaryScreen().size().height()
+        self._window_height_px = primary_screen_height()
+
+        self._graph: DSPGraph = None
+
+        self.__filter_backend = FILTER_BACKEND_FFT
+        self.__wavetable_anchors = DEFAULT_WAVETABLE_ANCHORS
+        self.__ramps = {}
+        self.__buffers = {}
         
 
-    def _set_samplerate(self, samplerate: float):
-        self._samplerate = samplerate
     def get_samplerate(self)->int:
         return self._samplerate
 
-    def get_samples(self, cffi_time, cursor_position, pressure) -> np.ndarray:
-        return np.zeros(BLOCKSIZE)
-
-    def _mix_samples(self, A: np.ndarray, B: np.ndarray):
-        B[:BLOCKSIZE] = (A * (1 - self.__zero_to_one)) + (B[:BLOCKSIZE] * self.__zero_to_one)
+    def _set_graph(self, output: Node):
+        """
+        output is the last node of the graph rendered by _render
+        """
+        self._graph = DSPGraph(output, self.get_samplerate(), self._smooth, self._blocksize)
+        self._graph.set_filter_backend(self.__filter_backend, self.__wavetable_anchors)
+
+    def get_blocksize(self) -> int:
+        return self._blocksize
+
+    def set_blocksize(self, blocksize: int):
+        """
+        rebuilds what is cached for each block at the new size, the player calls this while its stream is stopped
+        """
+        self._blocksize = blocksize
+        for ramp in self.__ramps.values():
+            ramp.set_frames(max(blocksize, VARIABLE_BLOCKSIZE_HOP))
+        if self._graph is not None:
+            self._graph.set_blocksize(blocksize)
+
+    def filter_backend(self) -> str:
+        return self.__filter_backend
+
+    def set_filter_backend(self, backend: str, wavetable_anchors: int = None):
+        """
+        the wavetable backend renders its tables here, so this should not be called from the audio thread
+        """
+        if wavetable_anchors is not None:
+            self.__wavetable_anchors = wavetable_anchors
+        self.__filter_backend = backend
+        if self._graph is not None:
+            self._graph.set_filter_backend(self.__filter_backend, self.__wavetable_anchors)
+
+    def can_idle(self) -> bool:
+        """
+        true when the source stays silent without pressure or movement, so the mixer can stop rendering it
+        """
+        return True
+
+    def get_samples(self, cffi_time, cursor_movement, pressure, out: np.ndarray, curves: InputCurves = None) -> np.ndarray:
+        """
+        renders the next block into out (its size is the number of frames) and returns it,
+        sources keep their own buffers so this shouldn't allocate.
+        curves has the pressure and speed for each sample of the block when the player has them
+        """
+        out.fill(0.0)
+        return out
+
+    def _render(self, out: np.ndarray, parameters: dict) -> np.ndarray:
+        """
+        renders the graph set in _set_graph into out, see DSPGraph.render for the parameters
+        """
+        return self._graph.render(out, parameters)
+
+    def __ramp(self, name: str) -> ParameterRamp:
+        ramp = self.__ramps.get(name)
+        if ramp is None:
+            time_constant, kind = self._smoothed_parameters[name]
+            ramp = ParameterRamp(time_constant, self.get_samplerate(), kind)
+            ramp.set_frames(max(self._blocksize, VARIABLE_BLOCKSIZE_HOP))
+            self.__ramps[name] = ramp
+        return ramp
+
+    def _smooth(self, name: str, target: float, frames: int):
+        """
+        per sample values of a parameter declared in _smoothed_parameters going to target,
+        undeclared parameters and targets that already have a value per sample are returned as they are
+        """
+        if name not in self._smoothed_parameters:
+            return target
+        if np.ndim(target) > 0:
+            self.__ramp(name).value = float(target[-1])
+            return target
+        return self.__ramp(name).process(target, frames)
+
+    def _smooth_value(self, name: str, target: float, frames: int) -> float:
+        """
+        value of a parameter declared in _smoothed_parameters at the end of the next frames,
+        for parameters that can only change once per block like the ones of the filters
+        """
+        if name not in self._smoothed_parameters:
+            return target
+        return self.__ramp(name).advance(target, frames)
+
+    def _smooth_gate(self, gate: int, frames: int, curves: InputCurves):
+        """
+        a gate of 0 or 1 for the gain, ramped with the "gate" parameter when the gain comes from the curves,
+        since per sample gains are not smoothed. Otherwise the gain ramp already smooths it
+        """
+        if curves is None:
+            self._smooth_value("gate", gate, frames)
+            return gate
+        return self._smooth("gate", gate, frames)
+
+    def _block_buffer(self, name: str, like):
+        """
+        buffer of the source for per sample values of a block, the size of like, reused by the next block.
+        None when like is a single value, so the helpers of utils return a single value too
+        """
+        if np.ndim(like) == 0:
+            return None
+        buffer = self.__buffers.get(name)
+        if buffer is None or buffer.size < like.size:
+            buffer = np.zeros(max(like.size, self._blocksize, VARIABLE_BLOCKSIZE_HOP), dtype=np.float32)
+            self.__buffers[name] = buffer
+        return buffer[:like.size]
+
+    def _generate_noise(self, loop_id: str, size: int, filters) -> WavObject:
+        """
+        filtered white noise, generated once and then loaded from the loop cache
+        """
+        samplerate = self.get_samplerate()
+        def generate():
+            samples = np.random.default_rng().random(size, dtype=np.float32)
+            ft_freq = np.fft.rfftfreq(samples.size, d=1/samplerate).astype(np.float32)
+            return apply_filter(samples, samplerate, frequencies_cache=ft_freq, filters=filters)
+
+        samples = loop_cache.get(loop_id, (size, samplerate, filters), generate)
+        return WavObject(samplerate, samples)
+
+    def _getSpeedCurve(self, curves: InputCurves) -> np.ndarray:
+        """
+        same as _getSpeed for each sample of the curves
+        """
+        speed = self._block_buffer("speed", curves.speed)
+        np.multiply(curves.speed, 1.0 / (self._window_height_px * self.max_speed), out=speed)
+        return np.clip(speed, 0.0, 1.0, out=speed)
 
     def _getSpeed(self, deltaTime, cursor_movement):
         deltaPx = math.sqrt((cursor_movement.x() ** 2) + (cursor_movement.y() ** 2))
@@ -71,93 +278,86 @@ class SFXSource:
         return clamp(speed, 0.0, 1.0)
 
 class SilenceSfx(SFXSource):
-    def __init__(self):
-        super().__init__()
-        self.__sound_of_silence = np.zeros(BLOCKSIZE)
-
-    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float) -> np.ndarray:
-        return self.__sound_of_silence[:]
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE):
+        super().__init__(samplerate)
 
 class EraserSfx(SFXSource):
-    def __init__(self):
-        super().__init__()
+    _smoothed_parameters = {
+        "gain": (0.02, RAMP_ONE_POLE),
+    }
+
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE):
+        super().__init__(samplerate)
 
         self.base_sound_data = self.__generate_eraser_noise()
         self.max_speed=4
-        self.__frames_processed = 0
+        self._set_graph(GainNode(LoopNode(self.base_sound_data.samples), "gain"))
         self.__last_callback_time = 0
-        self.__samples_as_last_callback = np.zeros(BLOCKSIZE)
 
 
-    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float) -> np.ndarray:
+    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float, out: np.ndarray,
+                    curves: InputCurves = None) -> np.ndarray:
         deltaTime = cffi_time.currentTime - self.__last_callback_time 
-        all_samples = self.__get_samples_from_base()
 
         speed =  self._getSpeed(deltaTime, cursor_movement)
+        if curves is not None:
+            speed, pressure = self._getSpeedCurve(curves), curves.pressure
 
-        all_samples *= speed * lerp(pressure, 0.7, 1.0)
+        gain = self._block_buffer("gain", pressure)
+        gain = np.multiply(speed, lerp_array(pressure, 0.7, 1.0, out=gain), out=gain)
+        filtered_samples = self._render(out, {"gain": gain})
 
-        self._mix_samples(self.__samples_as_last_callback, all_samples)
-        self.__samples_as_last_callback = all_samples[BLOCKSIZE:]
         self.__last_callback_time = cffi_time.currentTime
-        return all_samples[:BLOCKSIZE]
+        return filtered_samples
 
     def __generate_eraser_noise(self):
-        samples = np.random.rand(self.get_samplerate())
         filters = [
             PeakFilter(-100, 0, 25000, 38000, -0.7),
             PeakFilter(13000,15000,15100,17000,2),
             PeakFilter(17000, 18000, 24000, 30000, -1)
         ]
-        ft_freq = np.fft.fftfreq(samples.size, d=1/self.get_samplerate())
-        samples = apply_filter(samples, self.get_samplerate(), frequencies_cache=ft_freq, filters=filters)
-
-        pencil_sound = WavObject(self.get_samplerate(), samples)
-
-
-        return pencil_sound
-
-    def __get_samples_from_base(self):
-        samples = np.roll(self.base_sound_data.samples, shift=-self.__frames_processed)
-        self.__frames_processed += BLOCKSIZE
-        return samples[:BLOCKSIZE*2]
+        return self._generate_noise("eraser", self.get_samplerate(), filters)
 
 
 class PenSFXSource(SFXSource):
-    def __init__(self):
-        super().__init__()
+    _smoothed_parameters = {
+        "gain": (0.02, RAMP_ONE_POLE),
+        "filter_speed": (0.04, RAMP_ONE_POLE),
+    }
 
-        self.base_sound_data = self.__generate_pen_noise(1, self.get_samplerate())
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE):
+        super().__init__(samplerate)
 
-        self.__frames_processed = 0
-        self.__last_callback_time = 0
-        self.__samples_as_last_callback = np.zeros(BLOCKSIZE)
+        self.base_sound_data = self.__generate_pen_noise(1)
 
-        self.__frequencies_cache = np.fft.fftfreq(BLOCKSIZE*2, d=1/self.get_samplerate())
+        self._set_graph(GainNode(FilterNode(LoopNode(self.base_sound_data.samples), "pen", self.__build_filters), "gain"))
+        self.__last_callback_time = 0
 
-    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float) -> np.ndarray:
+    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float, out: np.ndarray,
+                    curves: InputCurves = None) -> np.ndarray:
         deltaTime = cffi_time.currentTime - self.__last_callback_time 
-        all_samples = self.__get_samples_from_base()
 
         speed =  self._getSpeed(deltaTime, cursor_movement)
+        if curves is not None:
+            speed, pressure = self._getSpeedCurve(curves), curves.pressure
+        # the filters only change once per block, they follow the average speed of the block
+        filter_parameters = (quantize(self._smooth_value("filter_speed", float(np.mean(speed)), out.size)),)
+        speed = log_curve(speed, out=self._block_buffer("speed", speed))
+        gain = self._block_buffer("gain", pressure)
+        gain = np.multiply(speed, lerp_array(pressure, 0.3, 1.0, out=gain), out=gain)
+        filtered_samples = self._render(out, {"gain": gain, "pen": filter_parameters})
+        self.__last_callback_time = cffi_time.currentTime
+        return filtered_samples
 
+    def __build_filters(self, speed):
         shift_by_speed = -50 + ( 125 * (speed**2))
-        filters =[
+        return [
             PeakFilter(650+shift_by_speed, 700+shift_by_speed, 720+shift_by_speed, 1320+shift_by_speed, 2),
             PeakFilter(650+shift_by_speed, 700+shift_by_speed, 720+shift_by_speed, 1320+shift_by_speed, 5), 
             #No, its not the same as using one PeakFilter with a bigger value
         ]
-        speed = math.log(9*speed + 1, 10)
-        all_samples *= speed *  lerp(pressure, 0.3, 1.0)
-        filtered_samples = apply_filter(all_samples, self.get_samplerate(), self.__frequencies_cache, filters)
-        self._mix_samples(self.__samples_as_last_callback, filtered_samples)
-
-        self.__samples_as_last_callback = filtered_samples[BLOCKSIZE:]
-        self.__last_callback_time = cffi_time.currentTime
-        return filtered_samples[:BLOCKSIZE]
 
-    def __generate_pen_noise(self, duration, frequency):
-        samples = np.random.rand(int(duration * frequency))
+    def __generate_pen_noise(self, duration):
         filters = [
             PeakFilter(-100, 0, 25000, 38000, -0.950),
             PeakFilter(-300, 570, 980, 2800, 12),
@@ -166,230 +366,208 @@ class PenSFXSource(SFXSource):
             PeakFilter(2500, 3000, 3010, 3500, 0.6), 
             PeakFilter(8000, 8300, 15000, 18000, -0.9),
         ]
-        ft_freq = np.fft.fftfreq(samples.size, d=1/frequency)
-        samples = apply_filter(samples, frequency, frequencies_cache=ft_freq, filters=filters)
-
-        pencil_sound = WavObject(frequency, samples)
-
-
-        return pencil_sound
-
-    def __get_samples_from_base(self):
-        samples = np.roll(self.base_sound_data.samples, shift=-self.__frames_processed)
-        self.__frames_processed += BLOCKSIZE
-        return samples[:BLOCKSIZE*2]
+        return self._generate_noise("pen", int(duration * self.get_samplerate()), filters)
 
 class PencilSFXSource(SFXSource):
-    def __init__(self):
-        super().__init__()
+    _smoothed_parameters = {
+        "gain": (0.02, RAMP_ONE_POLE),
+        "filter_pressure": (0.03, RAMP_ONE_POLE),
+    }
 
-        self.base_sound_data = generate_from_file(f"{dir_path}/assets/29a-pencil.wav")
-        self.base_sound_data.samples *= 15
-        self.max_speed = 8.0
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE):
+        super().__init__(samplerate)
 
-        self._set_samplerate(self.base_sound_data.samplerate)
+        self.base_sound_data = load_from_file(f"{dir_path}/assets/29a-pencil.wav", self.get_samplerate())
+        # the two channels of the recording are not correlated, averaging them made it sqrt(2) quieter than its first channel
+        self.base_sound_data.samples = self.base_sound_data.samples * (15 * math.sqrt(2))
+        self.max_speed = 8.0
 
-        self.__frames_processed = 0
+        self._set_graph(GainNode(FilterNode(LoopNode(self.base_sound_data.samples), "pencil", self.__build_filters), "gain"))
         self.__last_callback_time = 0
-        self.__samples_as_last_callback = np.zeros(BLOCKSIZE)
-
-        self.__frequencies_cache = np.fft.fftfreq(BLOCKSIZE*2, d=1/self.get_samplerate())
 
-    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float) -> np.ndarray:
+    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float, out: np.ndarray,
+                    curves: InputCurves = None) -> np.ndarray:
         deltaTime = cffi_time.currentTime - self.__last_callback_time 
-        all_samples = self.__get_samples_from_base()
 
         speed =  self._getSpeed(deltaTime, cursor_movement)
-        filters =[
-            PeakFilter(200,400,1000,1700,2.5 * clamp((2*pressure-1), 0, 1))
-        ]
-        speed = math.log(9*speed + 1, 10)
-        all_samples *= speed *  lerp(pressure, 0.3, 1.0)
-        filtered_samples = apply_filter(all_samples, self.get_samplerate(), self.__frequencies_cache, filters)
-        self._mix_samples(self.__samples_as_last_callback, filtered_samples)
-
-        self.__samples_as_last_callback = filtered_samples[BLOCKSIZE:]
+        if curves is not None:
+            speed, pressure = self._getSpeedCurve(curves), curves.pressure
+        # the filters only change once per block, they follow the average pressure of the block
+        filter_parameters = (quantize(self._smooth_value("filter_pressure", float(np.mean(pressure)), out.size)),)
+        speed = log_curve(speed, out=self._block_buffer("speed", speed))
+        gain = self._block_buffer("gain", pressure)
+        gain = np.multiply(speed, lerp_array(pressure, 0.3, 1.0, out=gain), out=gain)
+        filtered_samples = self._render(out, {"gain": gain, "pencil": filter_parameters})
         self.__last_callback_time = cffi_time.currentTime
-        return filtered_samples[:BLOCKSIZE]
+        return filtered_samples
 
-    def __get_samples_from_base(self):
-        samples = np.roll(self.base_sound_data.samples, shift=-self.__frames_processed)
-        self.__frames_processed += BLOCKSIZE
-        return samples[:BLOCKSIZE*2]
+    def __build_filters(self, pressure):
+        return [
+            PeakFilter(200,400,1000,1700,2.5 * clamp((2*pressure-1), 0, 1))
+        ]
 
 
 class PaintBrushSfx(SFXSource):
-    def __init__(self):
-        super().__init__()
+    _smoothed_parameters = {
+        "gain": (0.03, RAMP_ONE_POLE),
+        "filter_speed": (0.05, RAMP_ONE_POLE),
+    }
+
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE):
+        super().__init__(samplerate)
         self.base_sound_data = self.__generate_paintbrush_noise()
         self.max_speed = 8
 
-        self.__frames_processed = 0
+        self._set_graph(GainNode(FilterNode(LoopNode(self.base_sound_data.samples), "paintbrush", self.__build_filters),
+                                 "gain"))
         self.__last_callback_time = 0
-        self.__samples_as_last_callback = np.zeros(BLOCKSIZE)
 
-        self.__frequencies_cache = np.fft.fftfreq(BLOCKSIZE*2, d=1/self.get_samplerate())
-
-    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float) -> np.ndarray:
+    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float, out: np.ndarray,
+                    curves: InputCurves = None) -> np.ndarray:
         deltaTime = cffi_time.currentTime - self.__last_callback_time 
-        all_samples = self.__get_samples_from_base()
 
         speed =  self._getSpeed(deltaTime, cursor_movement)
-        pressure = smooth_lerp(pressure, 0.0,1.0)
+        if curves is not None:
+            speed, pressure = self._getSpeedCurve(curves), curves.pressure
+        # the filters only change once per block, they follow the average speed of the block
+        filter_parameters = (quantize(self._smooth_value("filter_speed", float(np.mean(speed)), out.size)),)
+        gain = self._block_buffer("gain", pressure)
+        pressure = smooth_lerp_array(pressure, 0.0,1.0, out=self._block_buffer("pressure", pressure), work=gain)
+        speed = np.power(speed, 1.75, out=self._block_buffer("speed", speed))
+        speed = log_curve(speed, out=self._block_buffer("speed", speed))
+        gain = np.multiply(speed, lerp_array(pressure, 0.1, 1.0, out=gain), out=gain)
+        filtered_samples = self._render(out, {"gain": gain, "paintbrush": filter_parameters})
+        self.__last_callback_time = cffi_time.currentTime
+        return filtered_samples
+
+    def __build_filters(self, speed):
         speed_shift = 500*(speed ** 1.2)
-        filters =[
+        return [
             PeakFilter(300+speed_shift, 800+speed_shift, 900+speed_shift, 1200+speed_shift, 0.9),
         ]
-        speed = speed **1.75
-        speed = math.log(9*speed + 1, 10)
-        all_samples *= speed *  lerp(pressure, 0.1, 1.0)
-        filtered_samples = apply_filter(all_samples, self.get_samplerate(), self.__frequencies_cache, filters)
-        self._mix_samples(self.__samples_as_last_callback, filtered_samples)
-
-        self.__samples_as_last_callback = filtered_samples[BLOCKSIZE:]
-        self.__last_callback_time = cffi_time.currentTime
-        return filtered_samples[:BLOCKSIZE]
 
     def __generate_paintbrush_noise(self):
-        samples = np.random.rand(self.get_samplerate())
         filters = [
             PeakFilter(-100, 0, 25000, 38000, -0.25),
             PeakFilter(-100, 0, 1200, 3800, 0.2),
         ]
-        ft_freq = np.fft.fftfreq(samples.size, d=1/self.get_samplerate())
-        samples = apply_filter(samples, self.get_samplerate(), frequencies_cache=ft_freq, filters=filters)
-
-        pencil_sound = WavObject(self.get_samplerate(), samples)
-
-        return pencil_sound
-
+        return self._generate_noise("paintbrush", self.get_samplerate(), filters)
 
-    def __get_samples_from_base(self):
-        samples = np.roll(self.base_sound_data.samples, shift=-self.__frames_processed)
-        self.__frames_processed += BLOCKSIZE
-        return samples[:BLOCKSIZE*2]
 
 class AirbrushSfx(SFXSource):
-    def __init__(self):
-        super().__init__()
+    _smoothed_parameters = {
+        "gain": (0.01, RAMP_LINEAR),
+        "gate": (0.01, RAMP_LINEAR),
+    }
+
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE):
+        super().__init__(samplerate)
         self.base_sound_data = self.__generate_airbrush_noise()
         
-        self.__frames_processed = 0
+        self._set_graph(GainNode(LoopNode(self.base_sound_data.samples), "gain"))
         self.__last_callback_time = 0
-        self.__samples_as_last_callback = np.zeros(BLOCKSIZE)
-
-        self.__frequencies_cache = np.fft.fftfreq(BLOCKSIZE*2, d=1/self.get_samplerate())
 
-        self._frames_since_last_move = 0
+        self._seconds_since_last_move = 0.0
 
-    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float) -> np.ndarray:
+    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float, out: np.ndarray,
+                    curves: InputCurves = None) -> np.ndarray:
         deltaTime = cffi_time.currentTime - self.__last_callback_time 
-        all_samples = self.__get_samples_from_base()
     
         speed =  self._getSpeed(deltaTime, cursor_movement)
         is_moving = 1 if speed > 0 else 0
         is_pressing = 1 if pressure > 0 else 0 
-        is_moving_smooth = 1 if is_moving or (self._frames_since_last_move <= 3 and is_pressing) else 0
-        self._frames_since_last_move = 0 if is_moving else self._frames_since_last_move + 1
-
-        filters =[]
-        all_samples *= is_pressing * lerp(pressure, 0.45, 1.0)
-        filtered_samples = apply_filter(all_samples, self.get_samplerate(), self.__frequencies_cache, filters)
-        self._mix_samples(self.__samples_as_last_callback, filtered_samples)
-
-        self.__samples_as_last_callback = filtered_samples[BLOCKSIZE:]
+        is_moving_smooth = 1 if is_moving or (self._seconds_since_last_move <= self.MOVING_HOLD_SECONDS and is_pressing) else 0
+        self._seconds_since_last_move = 0.0 if is_moving else self._seconds_since_last_move + (out.size / self.get_samplerate())
+
+        gate = self._smooth_gate(is_pressing, out.size, curves)
+        if curves is not None:
+            pressure = curves.pressure
+        gain = self._block_buffer("gain", pressure)
+        gain = np.multiply(gate, lerp_array(pressure, 0.45, 1.0, out=gain), out=gain)
+        filtered_samples = self._render(out, {"gain": gain})
         self.__last_callback_time = cffi_time.currentTime
-        return filtered_samples[:BLOCKSIZE]
+        return filtered_samples
 
     def __generate_airbrush_noise(self):
-        samples = np.random.rand(self.get_samplerate())
         filters = [
             PeakFilter(-100, 0, 25000, 38000, -0.52),
             PeakFilter(7000,11990,12010,17000, 4),
         ]
-        ft_freq = np.fft.fftfreq(samples.size, d=1/self.get_samplerate())
-        samples = apply_filter(samples, self.get_samplerate(), frequencies_cache=ft_freq, filters=filters)
+        return self._generate_noise("airbrush", self.get_samplerate(), filters)
 
-        airbrush_sound = WavObject(self.get_samplerate(), samples)
-
-        return airbrush_sound
-
-
-    def __get_samples_from_base(self):
-        samples = np.roll(self.base_sound_data.samples, shift=-self.__frames_processed)
-        self.__frames_processed += BLOCKSIZE
-        return samples[:BLOCKSIZE*2]
 
 
 class SpraycanSfx(SFXSource):
-    def __init__(self):
-        super().__init__()
+    _smoothed_parameters = {
+        "gain": (0.01, RAMP_LINEAR),
+        "gate": (0.01, RAMP_LINEAR),
+        "rattle": (0.02, RAMP_ONE_POLE),
+    }
+
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE):
+        super().__init__(samplerate)
         self.base_sound_data = self.__generate_spray_noise()
         self.base_rattle_sound_data = self.__load_rattle_sound()
         
-        self.__frames_processed = 0
-        self.__rattle_frames_processed = 0
+        self._set_graph(MixNode(
+            GainNode(LoopNode(self.base_sound_data.samples), "gain"),
+            GainNode(LoopNode(self.base_rattle_sound_data.samples), "rattle")
+        ))
         self.__last_callback_time = 0
-        self.__samples_as_last_callback = np.zeros(BLOCKSIZE)
 
-        self.__frames_since_last_move = 0
-        self.__last_qcursor_pos = QPoint(0,0)
+        self.__seconds_since_last_move = 0.0
         self.__last_cursor_speed = Vector2(0,0)
         self.__shakeness = 0.0
 
-        self.__frequencies_cache = np.fft.fftfreq(BLOCKSIZE*2, d=1/self.get_samplerate())
-
-    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float) -> np.ndarray:
+    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float, out: np.ndarray,
+                    curves: InputCurves = None) -> np.ndarray:
         deltaTime = cffi_time.currentTime - self.__last_callback_time 
-        all_samples = self.__get_samples_from_base()
-        rattle_samples = self.__get_samples_from_rattle_base()
 
         speed =  self._getSpeed(deltaTime, cursor_movement)
         is_moving = 1 if speed > 0 else 0
         is_pressing = 1 if pressure > 0 else 0 
-        is_moving_smooth = 1 if is_moving or (self.__frames_since_last_move <= 3 and is_pressing) else 0
-        self.__frames_since_last_move = 0 if is_moving else self.__frames_since_last_move + 1
+        is_moving_smooth = 1 if is_moving or (self.__seconds_since_last_move <= self.MOVING_HOLD_SECONDS and is_pressing) else 0
+        self.__seconds_since_last_move = 0.0 if is_moving else self.__seconds_since_last_move + (out.size / self.get_samplerate())
 
-        filters =[]
-        all_samples *= is_moving_smooth * lerp(pressure, 0.45, 1.0)
-        filtered_samples = apply_filter(all_samples, self.get_samplerate(), self.__frequencies_cache, filters)
-        self._mix_samples(self.__samples_as_last_callback, filtered_samples)
-
-        self.__samples_as_last_callback = filtered_samples[BLOCKSIZE:]
-
-        #adding rattle
-        qcursor_movement = self.__last_qcursor_pos - QCursor.pos() #detecting movement even when not pressing
+        #rattle
+        qcursor_movement = input_reader.hover_movement #detecting movement even when not pressing
         speed_vector = self.__get_speed_vector(deltaTime, qcursor_movement)
         acceleration_vector = speed_vector - self.__last_cursor_speed
         defiance = self.__last_cursor_speed.dot(acceleration_vector) * -1
         self.__shakeness += clamp(defiance, 0.0, -1*(is_pressing-1)) 
         self.__shakeness = clamp(self.__shakeness, 0.0, 1.0)
         
-        rattle_samples *= (self.__shakeness**2) if input_listener.is_over_canvas else 0
-        filtered_samples = filtered_samples +rattle_samples
+        rattle_gain = (self.__shakeness**2) if input_reader.snapshot.is_over_canvas else 0
+
+        gate = self._smooth_gate(is_moving_smooth, out.size, curves)
+        if curves is not None:
+            pressure = curves.pressure
+        gain = self._block_buffer("gain", pressure)
+        gain = np.multiply(gate, lerp_array(pressure, 0.45, 1.0, out=gain), out=gain)
+        filtered_samples = self._render(out, {"gain": gain, "rattle": rattle_gain})
 
         self.__shakeness -= 2.0 * deltaTime
         self.__last_cursor_speed = speed_vector
-        self.__last_qcursor_pos = QCursor.pos()
         self.__last_callback_time = cffi_time.currentTime
-        return filtered_samples[:BLOCKSIZE]
+        return filtered_samples
+
+    def can_idle(self) -> bool:
+        # the can rattles when the cursor shakes without pressing, it rests once the shaking died down
+        hover_movement = input_reader.hover_movement
+        return self.__shakeness <= 0.0 and hover_movement.x() == 0 and hover_movement.y() == 0
 
     def __generate_spray_noise(self):
-        samples = np.random.rand(self.get_samplerate())
         filters = [
             PeakFilter(-100, 0, 25000, 38000, -0.58),
             PeakFilter(3250,11990,12010,20750, 4),
         ]
-        ft_freq = np.fft.fftfreq(samples.size, d=1/self.get_samplerate())
-        samples = apply_filter(samples, self.get_samplerate(), frequencies_cache=ft_freq, filters=filters)
-
-        spray_sound = WavObject(self.get_samplerate(), samples)
-
-        return spray_sound
+        return self._generate_noise("spray", self.get_samplerate(), filters)
     
     def __load_rattle_sound(self):
-        spray_record = generate_from_file(f"{dir_path}/assets/spray-paint-shake-seven-87908.wav")
-        middle = spray_record.samples[12400:60000]
+        spray_record = load_from_file(f"{dir_path}/assets/spray-paint-shake-seven-87908.wav", self.get_samplerate())
+        # the shaking is between these frames of the 48000Hz recording
+        to_frames = self.get_samplerate() / 48000
+        middle = spray_record.samples[int(12400 * to_frames):int(60000 * to_frames)]
         spray_record.samples = middle
         return spray_record
 
@@ -404,12 +582,85 @@ class SpraycanSfx(SFXSource):
 
         return Vector2.clamp_lenght(speed, 0.0, 1.0)
 
-    def __get_samples_from_base(self):
-        samples = np.roll(self.base_sound_data.samples, shift=-self.__frames_processed)
-        self.__frames_processed += BLOCKSIZE
-        return samples[:BLOCKSIZE*2]
 
-    def __get_samples_from_rattle_base(self):
-        samples = np.roll(self.base_rattle_sound_data.samples, shift=-self.__rattle_frames_processed)
-        self.__rattle_frames_processed += BLOCKSIZE
-        return samples[:BLOCKSIZE*2]
\ No newline at end of file
+class SamplePackSfx(SFXSource):
+    """
+    Plays the samples of a user sample pack (see sample_packs) one after the other in a loop,
+    with the gain curves of its manifest
+    """
+    _smoothed_parameters = {
+        "gain": (0.02, RAMP_ONE_POLE),
+    }
+    # short fade at both ends of each sample so the joins don't click
+    EDGE_FADE_SECONDS = 0.005
+    # the speed curve is looked up in a table of this many steps, np.interp can't write to a buffer
+    SPEED_CURVE_STEPS = 1024
+
+    def __init__(self, samplerate: int = DEFAULT_SAMPLERATE, pack=None):
+        super().__init__(samplerate)
+        if pack is None:
+            raise Exception("SamplePackSfx needs a sample pack")
+        self.pack = pack
+
+        self.base_sound_data = self.__load_pack_samples()
+        self.max_speed = pack.max_speed
+        self.__curve_speeds = np.array([speed for speed, _ in pack.speed_curve], dtype=np.float32)
+        self.__curve_gains = np.array([gain for _, gain in pack.speed_curve], dtype=np.float32)
+        self.__speed_gain_table = np.interp(np.linspace(0.0, 1.0, self.SPEED_CURVE_STEPS + 1),
+                                            self.__curve_speeds, self.__curve_gains).astype(np.float32)
+        self.__table_indices = np.zeros(0, dtype=np.intp)
+
+        self._set_graph(GainNode(LoopNode(self.base_sound_data.samples), "gain"))
+        self.__last_callback_time = 0
+
+    def get_samples(self, cffi_time, cursor_movement: QPoint, pressure: float, out: np.ndarray,
+                    curves: InputCurves = None) -> np.ndarray:
+        deltaTime = cffi_time.currentTime - self.__last_callback_time
+
+        speed = self._getSpeed(deltaTime, cursor_movement)
+        if curves is not None:
+            speed, pressure = self._getSpeedCurve(curves), curves.pressure
+        lower_gain, higher_gain = self.pack.pressure_gain
+        gain = self._block_buffer("gain", pressure)
+        gain = np.multiply(self.__speedGain(speed), lerp_array(pressure, lower_gain, higher_gain, out=gain), out=gain)
+        gain = np.multiply(gain, self.pack.gain, out=self._block_buffer("gain", gain))
+        filtered_samples = self._render(out, {"gain": gain})
+
+        self.__last_callback_time = cffi_time.currentTime
+        return filtered_samples
+
+    def __speedGain(self, speed):
+        if np.ndim(speed) == 0:
+            return float(np.interp(speed, self.__curve_speeds, self.__curve_gains))
+        if self.__table_indices.size < speed.size:
+            self.__table_indices = np.zeros(speed.size, dtype=np.intp)
+        indices = self.__table_indices[:speed.size]
+        speed_gain = self._block_buffer("speed_gain", speed)
+        np.multiply(speed, self.SPEED_CURVE_STEPS, out=speed_gain)
+        np.rint(speed_gain, out=speed_gain)
+        indices[:] = speed_gain
+        return np.take(self.__speed_gain_table, indices, mode="clip", out=speed_gain)
+
+    def __load_pack_samples(self) -> WavObject:
+        samplerate = self.get_samplerate()
+        filters = self.pack.filters
+        def generate():
+            fade_size = int(self.EDGE_FADE_SECONDS * samplerate)
+            parts = []
+            for path in self.pack.samples:
+                audio = generate_from_file(path)
+                samples = resample(audio.samples, audio.samplerate, samplerate)
+                fade = np.linspace(0.0, 1.0, min(fade_size, samples.size // 2), dtype=np.float32)
+                if fade.size > 0:
+                    samples[:fade.size] *= fade
+                    samples[-fade.size:] *= fade[::-1]
+                parts.append(samples)
+            samples = np.concatenate(parts)
+            if filters:
+                ft_freq = np.fft.rfftfreq(samples.size, d=1/samplerate).astype(np.float32)
+                samples = apply_filter(samples, samplerate, frequencies_cache=ft_freq, filters=filters)
+            return samples.astype(np.float32, copy=False)
+
+        # the signature changes with any of the pack's files, so an edited pack is decoded again
+        samples = loop_cache.get(f"pack_{self.pack.id}", (self.pack.signature, samplerate, filters), generate)
+        return WavObject(samplerate, samples)
@@ -0,0 +1,61 @@
+from .Qt.QtCore import QObject, QThread
+
+import queue
+import itertools
+from concurrent.futures import Future
+
+from .sound_source import primary_screen_height
+
+class SoundSourceBuilderThread(QThread):
+    def __init__(self, jobs: queue.PriorityQueue, pending_jobs: dict):
+        super().__init__()
+        self.__jobs = jobs
+        self.__pending_jobs = pending_jobs
+
+    def run(self):
+        while True:
+            priority, _, future, job = self.__jobs.get()
+            # promoted jobs are queued twice, the second one finds the future already done
+            if future.done() or future.running() or not future.set_running_or_notify_cancel():
+                continue
+            self.__pending_jobs.pop(future, None)
+
+            self.setPriority(QThread.Priority.IdlePriority if priority > 0 else QThread.Priority.NormalPriority)
+            try:
+                future.set_result(job())
+            except Exception as error:
+                print(f"[BrushSfx] Failed to build sound source: {error}")
+                future.set_exception(error)
+
+class SoundSourceFactory(QObject):
+    """
+    Runs the construction of sound sources (and anything else too heavy for the GUI thread) on a worker thread.
+    Prefetch jobs run at idle priority after every requested job
+    """
+    def __init__(self):
+        super().__init__()
+        self.__jobs = queue.PriorityQueue()
+        self.__pending_jobs = {}
+        self.__job_order = itertools.count()
+
+        self.__builder_thread = SoundSourceBuilderThread(self.__jobs, self.__pending_jobs)
+        self.__builder_thread.start()
+
+    def submit(self, job, prefetch: bool = False) -> Future:
+        # sound sources read the screen size, which has to happen on the GUI thread
+        primary_screen_height()
+
+        future = Future()
+        self.__pending_jobs[future] = job
+        self.__jobs.put((1 if prefetch else 0, next(self.__job_order), future, job))
+        return future
+
+    def promote(self, future: Future):
+        """
+        moves a prefetch job that hasn't started yet in front of the other prefetches
+        """
+        job = self.__pending_jobs.get(future)
+        if job is not None:
+            self.__jobs.put((0, next(self.__job_order), future, job))
+
+sound_source_factory = SoundSourceFactory()
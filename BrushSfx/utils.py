@@ -65,14 +65,92 @@ def clamp(x: float, lower_limit: float = 0.0, upper_limit: float = 1.0) ->float:
     return x
 
 
-def lerp_array(t: np.ndarray, a: float, b: float):
-    t = np.clip(t, 0.0, 1.0)
-    return a + ((b-a) * t)
-
-def smooth_lerp_array(t: np.ndarray, a: float, b: float):
-    t = np.clip(t, 0.0, 1.0)
-    t = t * t * (3.0 - 2.0 * t)
-    return a + ((b-a) * t)
+def quantize(x: float, steps: int = 64) -> float:
+    return round(x * steps) / steps
+
+def lerp_array(t: np.ndarray, a: float, b: float, out: np.ndarray = None):
+    """
+    the result is written to out when given, it can be t itself
+    """
+    if out is None:
+        t = np.clip(t, 0.0, 1.0)
+        return a + ((b-a) * t)
+    np.clip(t, 0.0, 1.0, out=out)
+    out *= (b-a)
+    out += a
+    return out
+
+def smooth_lerp_array(t: np.ndarray, a: float, b: float, out: np.ndarray = None, work: np.ndarray = None):
+    """
+    the result is written to out when given, which also needs a work buffer of the same size
+    """
+    if out is None:
+        t = np.clip(t, 0.0, 1.0)
+        t = t * t * (3.0 - 2.0 * t)
+        return a + ((b-a) * t)
+    np.clip(t, 0.0, 1.0, out=out)
+    np.multiply(out, out, out=work)
+    out *= -2.0
+    out += 3.0
+    out *= work
+    return lerp_array(out, a, b, out=out)
+
+def log_curve(x, out: np.ndarray = None):
+    """
+    log10(9x + 1), goes from 0 to 1 like x but rises faster at the start.
+    The result is written to out when given, it can be x itself
+    """
+    if out is None:
+        return np.log10(9*x + 1)
+    np.multiply(x, 9.0, out=out)
+    out += 1.0
+    return np.log10(out, out=out)
+
+def fill_piecewise_linear(out: np.ndarray, offsets: np.ndarray, samplerate: int, points):
+    """
+    Same as np.interp(offsets, times, values) for the (time, value) points, written to out without allocating.
+    offsets[i] has to be i / samplerate, so each segment between two points fills a slice of out,
+    points have to be sorted by time
+    """
+    frames = out.size
+    filled = 0
+    previous = None
+    for point in points:
+        point_time, value = point
+        end = min(max(math.ceil(point_time * samplerate), 0), frames)
+        if previous is None:
+            out[:end] = value
+        elif end > filled:
+            previous_time, previous_value = previous
+            segment = out[filled:end]
+            np.subtract(offsets[filled:end], previous_time, out=segment)
+            segment *= (value - previous_value) / (point_time - previous_time)
+            segment += previous_value
+        filled = max(filled, end)
+        previous = point
+    if previous is not None:
+        out[filled:] = previous[1]
+    return out
+
+class UnitRamp:
+    """
+    Values going from 1/frames up to 1 for blocks of any number of frames.
+    The buffers only grow, so a block smaller than the largest one so far doesn't allocate
+    """
+    def __init__(self):
+        self.__steps = np.zeros(0, dtype=np.float32)
+        self.__ramp = np.zeros(0, dtype=np.float32)
+
+    def get(self, frames: int) -> np.ndarray:
+        """
+        the returned buffer is reused by the next call
+        """
+        if self.__steps.size < frames:
+            self.__steps = np.arange(1, frames + 1, dtype=np.float32)
+            self.__ramp = np.zeros(frames, dtype=np.float32)
+        ramp = self.__ramp[:frames]
+        np.multiply(self.__steps[:frames], 1.0 / frames, out=ramp)
+        return ramp
 
 def qpoint_lenght(point: QPoint) ->float:
     return math.sqrt((point.x() ** 2) + (point.y() ** 2))
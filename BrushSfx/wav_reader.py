@@ -0,0 +1,124 @@
+import os
+import struct
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# (format, bits per sample) -> dtype of a sample in the file, 24 bit samples are read as 3 bytes
+_SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype(np.uint8),
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 24): np.dtype(np.uint8),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+}
+
+class WavReader:
+    """
+    Reads the samples of a WAV file straight from a memory map of its data chunk.
+    8, 16, 24 and 32 bit integer and 32 bit float files are decoded, channels are averaged down to mono.
+    Nothing is decoded until read() or a slice asks for it, so only the frames used are ever loaded
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            file_size = os.fstat(file.fileno()).st_size
+            riff, _, wave = struct.unpack("<4sI4s", file.read(12))
+            if riff != b"RIFF" or wave != b"WAVE":
+                raise Exception(f"{path} is not a WAV file")
+
+            fmt = None
+            data_offset = None
+            data_size = 0
+            while True:
+                header = file.read(8)
+                if len(header) < 8:
+                    break
+                chunk_id, chunk_size = struct.unpack("<4sI", header)
+                if chunk_id == b"fmt ":
+                    fmt = file.read(chunk_size)
+                    file.seek(chunk_size % 2, os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    data_offset = file.tell()
+                    # recorders that were stopped early leave a wrong size, the file size is the limit
+                    data_size = min(chunk_size, file_size - data_offset)
+                    break
+                else:
+                    file.seek(chunk_size + (chunk_size % 2), os.SEEK_CUR)
+
+        if fmt is None or data_offset is None:
+            raise Exception(f"{path} has no fmt or data chunk")
+
+        format_tag, self.channels, self.samplerate, _, block_align, self.bits_per_sample = struct.unpack("<HHIIHH", fmt[:16])
+        if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            # the real format is the start of the sub format GUID
+            format_tag = struct.unpack("<H", fmt[24:26])[0]
+        self.format_tag = format_tag
+
+        sample_dtype = _SAMPLE_DTYPES.get((format_tag, self.bits_per_sample))
+        if sample_dtype is None:
+            raise Exception(f"{path} uses an unsupported format ({format_tag}, {self.bits_per_sample} bits)")
+        if self.channels < 1 or block_align != self.channels * self.bits_per_sample // 8:
+            raise Exception(f"{path} has an invalid block alignment")
+
+        frames = data_size // block_align
+        shape = (frames, self.channels, 3) if self.bits_per_sample == 24 else (frames, self.channels)
+        if frames > 0:
+            self.__frames = np.memmap(path, dtype=sample_dtype, mode="r", offset=data_offset, shape=shape)
+        else:
+            self.__frames = np.zeros(shape, dtype=sample_dtype)
+
+    @property
+    def frames(self) -> int:
+        return self.__frames.shape[0]
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, index) -> np.ndarray:
+        """
+        a slice of frames decoded to mono float32
+        """
+        if not isinstance(index, slice):
+            raise Exception("WavReader can only be sliced")
+        start, stop, step = index.indices(self.frames)
+        return self.__decode(self.__frames[start:stop:step])
+
+    def read(self, start: int = 0, count: int = None) -> np.ndarray:
+        """
+        count frames from start decoded to mono float32, up to the end of the file when count is None
+        """
+        stop = self.frames if count is None else min(start + count, self.frames)
+        return self[start:stop]
+
+    def close(self):
+        """
+        releases the memory map, arrays returned before stay valid
+        """
+        self.__frames = self.__frames[:0].copy()
+
+    def __decode(self, raw: np.ndarray) -> np.ndarray:
+        if self.bits_per_sample == 8:
+            # 8 bit samples are unsigned
+            samples = raw.astype(np.float32)
+            samples -= 128.0
+            samples *= 1.0 / 128
+        elif self.bits_per_sample == 24:
+            # the high byte carries the sign, reading it as int8 sign extends the whole sample
+            samples = raw[..., 2].astype(np.int8).astype(np.int32) << 16
+            samples |= raw[..., 1].astype(np.int32) << 8
+            samples |= raw[..., 0]
+            samples = samples.astype(np.float32)
+            samples *= 1.0 / (1 << 23)
+        elif self.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            samples = raw.astype(np.float32)
+        else:
+            samples = raw.astype(np.float32)
+            samples *= 1.0 / (1 << (self.bits_per_sample - 1))
+
+        if self.channels == 1:
+            return np.asarray(samples[:, 0])
+        return np.asarray(samples.mean(axis=1, dtype=np.float32))